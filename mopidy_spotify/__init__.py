@@ -39,16 +39,28 @@ class Extension(ext.Extension):
         schema['allow_cache'] = config.Boolean()
         schema['allow_network'] = config.Boolean()
         schema['allow_playlists'] = config.Boolean()
+        schema['playlist_refresh_concurrency'] = config.Integer(minimum=1)
 
         schema['search_album_count'] = config.Integer(minimum=0, maximum=200)
         schema['search_artist_count'] = config.Integer(minimum=0, maximum=200)
         schema['search_track_count'] = config.Integer(minimum=0, maximum=200)
+        schema['search_per_type'] = config.Boolean()
+        schema['web_artist_lookup'] = config.Boolean()
+
+        schema['image_proxy'] = config.Boolean()
 
         schema['toplist_countries'] = config.List(optional=True)
 
         return schema
 
     def setup(self, registry):
+        from mopidy_spotify import image_proxy
         from mopidy_spotify.backend import SpotifyBackend
+        from mopidy_spotify.frontend import SpotifyFrontend
 
+        registry.add('http:app', {
+            'name': self.ext_name,
+            'factory': image_proxy.factory,
+        })
         registry.add('backend', SpotifyBackend)
+        registry.add('frontend', SpotifyFrontend)
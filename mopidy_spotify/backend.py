@@ -10,7 +10,7 @@ import pykka
 
 import spotify
 
-from mopidy_spotify import Extension, library, playback, playlists, web
+from mopidy_spotify import Extension, images, library, playback, playlists, web
 
 
 logger = logging.getLogger(__name__)
@@ -39,6 +39,8 @@ class SpotifyBackend(pykka.ThreadingActor, backend.Backend):
         self._event_loop = None
         self._bitrate = None
         self._web_client = None
+        self._web_thread = None
+        self._web_stopped = threading.Event()
 
         self.library = library.SpotifyLibraryProvider(backend=self)
         self.playback = playback.SpotifyPlaybackProvider(
@@ -60,15 +62,51 @@ class SpotifyBackend(pykka.ThreadingActor, backend.Backend):
             self._config['spotify']['username'],
             self._config['spotify']['password'])
 
+        if self._config['spotify']['allow_cache']:
+            cache_dir = Extension().get_cache_dir(self._config)
+            playlists._cache = web.WebResponseCache(
+                os.path.join(cache_dir, 'web'))
+            images._cache = images.ImageCache(
+                os.path.join(cache_dir, 'images.db'))
+
+        images._use_local_uris = self._config['spotify']['image_proxy']
+
         self._web_client = web.SpotifyOAuthClient(
             self._config['spotify']['client_id'],
             self._config['spotify']['client_secret'], self._config['proxy'])
-        self._web_client.login()
 
-        if self.playlists is not None:
+        # Logging in to the Web API and loading all playlists can take a long
+        # time, so do it in the background instead of blocking the actor.
+        self._web_thread = threading.Thread(
+            target=self._load_web_data, name='SpotifyWebLoader')
+        self._web_thread.daemon = True
+        self._web_thread.start()
+
+    def _load_web_data(self):
+        # Called from a background thread, and not in an actor context.
+        try:
+            self._web_client.login()
+            if self.playlists is None or self._web_stopped.is_set():
+                return
             self.playlists.refresh()
+        except Exception:
+            logger.exception('Loading Spotify Web API data failed')
+            if self.playlists is None:
+                return
+            # Stop holding back playlists that weren't refreshed, so they are
+            # fetched on demand instead.
+            self.playlists._loaded = True
+
+        if not self._web_stopped.is_set():
+            playlists.on_playlists_loaded()
 
     def on_stop(self):
+        self._web_stopped.set()
+        if self._web_thread is not None:
+            self._web_thread.join(self._config['spotify']['timeout'])
+            if self._web_thread.is_alive():
+                logger.debug('Not waiting any longer for Spotify Web API data')
+
         logger.debug('Logging out of Spotify')
         self._session.logout()
         self._logged_out.wait()
@@ -0,0 +1,48 @@
+from __future__ import unicode_literals
+
+import logging
+
+from mopidy import core
+
+import pykka
+
+from mopidy_spotify import backend
+
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyFrontend(pykka.ThreadingActor, core.CoreListener):
+    """Tell the Spotify backend which track will be played next.
+
+    The backend only learns about the next track when the audio layer asks
+    for it, so this frontend follows the tracklist and lets the backend
+    prefetch the next track while the current track is still playing.
+    """
+
+    def __init__(self, config, core):
+        super(SpotifyFrontend, self).__init__()
+        self._core = core
+
+    def track_playback_started(self, tl_track):
+        self._prefetch_next_track()
+
+    def tracklist_changed(self):
+        if self._core.playback.get_current_tl_track().get() is not None:
+            self._prefetch_next_track()
+
+    def options_changed(self):
+        self.tracklist_changed()
+
+    def _prefetch_next_track(self):
+        tlid = self._core.tracklist.get_eot_tlid().get()
+        if tlid is None:
+            return
+
+        tl_tracks = self._core.tracklist.filter({'tlid': [tlid]}).get()
+        if not tl_tracks or not tl_tracks[0].track.uri.startswith('spotify:'):
+            return
+
+        for backend_ref in pykka.ActorRegistry.get_by_class(
+                backend.SpotifyBackend):
+            backend_ref.proxy().playback.prefetch(tl_tracks[0].track)
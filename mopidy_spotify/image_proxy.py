@@ -0,0 +1,125 @@
+from __future__ import unicode_literals
+
+import imghdr
+import logging
+import os
+import tempfile
+import time
+from concurrent import futures
+
+import requests
+
+import tornado.gen
+import tornado.web
+
+from mopidy_spotify import Extension, utils
+
+
+logger = logging.getLogger(__name__)
+
+_CDN_URL = 'https://i.scdn.co/image/'
+
+# Images that haven't been served for this many seconds are deleted from the
+# cache directory when Mopidy starts.
+_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Number of images downloaded at the same time.
+_MAX_DOWNLOADS = 4
+
+# IOLoop.run_in_executor() needs Tornado 5, while Mopidy 2 works with older
+# versions, so use an explicit executor that coroutines can yield from.
+_executor = futures.ThreadPoolExecutor(max_workers=_MAX_DOWNLOADS)
+
+
+def factory(config, core):
+    if not config['spotify']['image_proxy']:
+        return []
+
+    cache_dir = os.path.join(Extension().get_cache_dir(config), 'images')
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    _prune(cache_dir, _CACHE_MAX_AGE)
+
+    return [
+        (r'/images/([0-9a-f]+)', ImageHandler, {
+            'cache_dir': cache_dir,
+            'session': utils.get_requests_session(config['proxy']),
+            'timeout': config['spotify']['timeout'],
+        }),
+    ]
+
+
+class ImageHandler(tornado.web.RequestHandler):
+    """Serve images from Spotify's CDN, downloading each image only once."""
+
+    def initialize(self, cache_dir, session, timeout):
+        self._cache_dir = cache_dir
+        self._session = session
+        self._timeout = timeout
+
+    @tornado.gen.coroutine
+    def get(self, image_id):
+        path = os.path.join(self._cache_dir, image_id)
+        data = _read(path)
+
+        if data is None:
+            try:
+                data = yield _fetch(
+                    self._session, _CDN_URL + image_id, self._timeout)
+            except requests.RequestException as exc:
+                logger.debug('Fetching image %s failed: %s', image_id, exc)
+                raise tornado.web.HTTPError(502)
+            _write(path, data)
+
+        image_type = imghdr.what(None, data) or 'jpeg'
+        self.set_header('Content-Type', 'image/%s' % image_type)
+        # Spotify never changes the image for an image ID.
+        self.set_header('Cache-Control', 'public, max-age=31536000')
+        self.write(data)
+
+
+def _fetch(session, url, timeout):
+    # requests respects Mopidy's proxy config, but blocks, so download in a
+    # thread to keep the IOLoop free.
+    return _executor.submit(_download, session, url, timeout)
+
+
+def _download(session, url, timeout):
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        os.utime(path, None)  # Keep images that are in use from being pruned.
+        return data
+    except (IOError, OSError):
+        return None
+
+
+def _write(path, data):
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as exc:
+        logger.warning('Caching image %s failed: %s', path, exc)
+
+
+def _prune(cache_dir, max_age):
+    expired = time.time() - max_age
+    pruned = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+                pruned += 1
+        except OSError as exc:
+            logger.debug('Pruning cached image %s failed: %s', path, exc)
+    if pruned:
+        logger.debug('Pruned %d unused images from %s', pruned, cache_dir)
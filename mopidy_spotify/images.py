@@ -1,12 +1,21 @@
 from __future__ import unicode_literals
 
+import collections
 import itertools
+import json
 import logging
 import operator
+import re
+import sqlite3
+import threading
+import time
+import urllib
 import urlparse
 
 from mopidy import models
 
+from mopidy_spotify import utils
+
 
 # NOTE: This module is independent of libspotify and built using the Spotify
 # Web APIs. As such it does not tie in with any of the regular code used
@@ -15,15 +24,29 @@ from mopidy import models
 
 _API_MAX_IDS_PER_REQUEST = 50
 
+_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Number of track to album mappings kept for image lookups.
+_TRACK_ALBUMS_MAX_ENTRIES = 10000
+
+_CDN_URL_RE = re.compile(r'^https?://i\.scdn\.co/image/([0-9a-f]+)$')
+_LOCAL_URI_PREFIX = '/spotify/images/'
+
 _cache = {}  # (type, id) -> [Image(), ...]
+_track_albums = utils.LRUCache(_TRACK_ALBUMS_MAX_ENTRIES)  # track -> album id
+
+# Whether to return local image URIs served by the image proxy.
+_use_local_uris = False
 
 logger = logging.getLogger(__name__)
 
 
 def get_images(web_client, uris):
     result = {}
+    batches = []
     uri_type_getter = operator.itemgetter('type')
-    uris = sorted((_parse_uri(u) for u in uris), key=uri_type_getter)
+    uris = sorted(
+        (_use_known_album(_parse_uri(u)) for u in uris), key=uri_type_getter)
     for uri_type, group in itertools.groupby(uris, uri_type_getter):
         batch = []
         for uri in group:
@@ -32,13 +55,88 @@ def get_images(web_client, uris):
             else:
                 batch.append(uri)
                 if len(batch) >= _API_MAX_IDS_PER_REQUEST:
-                    result.update(
-                        _process_uris(web_client, uri_type, batch))
+                    batches.append((uri_type, batch))
                     batch = []
-        result.update(_process_uris(web_client, uri_type, batch))
+        if batch:
+            batches.append((uri_type, batch))
+
+    for batch_result in _process_batches(web_client, batches):
+        result.update(batch_result)
+
+    if _use_local_uris:
+        result = {
+            uri: tuple(_to_local_image(image) for image in images)
+            for uri, images in result.items()}
     return result
 
 
+def add_track_albums(web_tracks):
+    """Remember the albums of tracks from Web API responses.
+
+    Images of these tracks are then looked up from their album, without
+    requesting the tracks.
+    """
+    for web_track in web_tracks:
+        if not web_track:
+            continue
+        try:
+            album = _parse_uri((web_track.get('album') or {}).get('uri', ''))
+        except ValueError:
+            continue
+        # Relinked tracks may be asked for by their original URI.
+        track_uris = [
+            web_track.get('uri'),
+            (web_track.get('linked_from') or {}).get('uri')]
+        for track_uri in filter(None, track_uris):
+            try:
+                track = _parse_uri(track_uri)
+            except ValueError:
+                continue
+            _track_albums[track['id']] = album['id']
+
+
+def _use_known_album(uri):
+    album_id = None
+    if uri['type'] == 'track':
+        album_id = _track_albums.get(uri['id'])
+    if album_id is None:
+        return uri
+    return dict(uri, type='album', id=album_id, key=('album', album_id))
+
+
+def _process_batches(web_client, batches):
+    if not batches:
+        return []
+
+    # Several URIs can share an ID, e.g. tracks that are looked up by album.
+    batches = [
+        (uri_type, _group_by_id(uris)) for uri_type, uris in batches]
+
+    # Request all batches concurrently, so fetching many images takes about
+    # as long as a single request.
+    paths = [
+        '%ss?%s' % (uri_type, urllib.urlencode({'ids': ','.join(ids_to_uris)}))
+        for uri_type, ids_to_uris in batches]
+    new_images = {}
+    results = [
+        _process_uris(uri_type, ids_to_uris, data, new_images)
+        for (uri_type, ids_to_uris), data in zip(
+            batches, web_client.get_many(paths))]
+
+    # Store all new images at once, so a persistent cache commits them in a
+    # single transaction.
+    if new_images:
+        _cache.update(new_images)
+    return results
+
+
+def _group_by_id(uris):
+    ids_to_uris = collections.OrderedDict()
+    for u in uris:
+        ids_to_uris.setdefault(u['id'], []).append(u)
+    return ids_to_uris
+
+
 def _parse_uri(uri):
     parsed_uri = urlparse.urlparse(uri)
     uri_type, uri_id = None, None
@@ -56,33 +154,160 @@ def _parse_uri(uri):
     raise ValueError('Could not parse %r as a Spotify URI' % uri)
 
 
-def _process_uris(web_client, uri_type, uris):
+def _process_uris(uri_type, ids_to_uris, data, new_images):
     result = {}
-    ids = [u['id'] for u in uris]
-    ids_to_uris = {u['id']: u for u in uris}
-
-    if not uris:
-        return result
-
-    data = web_client.get(uri_type + 's', params={'ids': ','.join(ids)})
     for item in data.get(uri_type + 's', []):
         if not item:
             continue
-        uri = ids_to_uris[item['id']]
-        if uri['key'] not in _cache:
-            if uri_type == 'track':
-                album_key = _parse_uri(item['album']['uri'])['key']
-                if album_key not in _cache:
-                    _cache[album_key] = tuple(
-                        _translate_image(i) for i in item['album']['images'])
-                _cache[uri['key']] = _cache[album_key]
-            else:
-                _cache[uri['key']] = tuple(
-                    _translate_image(i) for i in item['images'])
-        result[uri['uri']] = _cache[uri['key']]
+        for uri in ids_to_uris[item['id']]:
+            if uri['key'] not in new_images:
+                if uri_type == 'track':
+                    album_key = _parse_uri(item['album']['uri'])['key']
+                    album_images = new_images.get(album_key)
+                    if album_images is None:
+                        album_images = _cache.get(album_key)
+                    if album_images is None:
+                        album_images = new_images[album_key] = tuple(
+                            _translate_image(i)
+                            for i in item['album']['images'])
+                    new_images[uri['key']] = album_images
+                else:
+                    new_images[uri['key']] = tuple(
+                        _translate_image(i) for i in item['images'])
+            result[uri['uri']] = new_images[uri['key']]
 
     return result
 
 
 def _translate_image(i):
     return models.Image(uri=i['url'], height=i['height'], width=i['width'])
+
+
+def _to_local_image(image):
+    match = _CDN_URL_RE.match(image.uri)
+    if match is None:
+        return image
+    return image.replace(uri=_LOCAL_URI_PREFIX + match.group(1))
+
+
+class ImageCache(collections.MutableMapping):
+    """Mapping of ``(type, id)`` to images, persisted in an SQLite database.
+
+    Entries older than ``max_age`` seconds are treated as missing, and are
+    removed from the database when it is opened. If the database can't be
+    used, the cache only keeps entries in memory.
+    """
+
+    def __init__(self, path, max_age=_CACHE_MAX_AGE):
+        self._max_age = max_age
+        self._data = {}
+        self._lock = threading.Lock()
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            with self._db:
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS images ('
+                    'key TEXT PRIMARY KEY, images TEXT NOT NULL, '
+                    'stored REAL NOT NULL)')
+                self._db.execute(
+                    'DELETE FROM images WHERE stored < ?',
+                    (time.time() - max_age,))
+        except sqlite3.Error as exc:
+            logger.warning('Opening image cache %s failed: %s', path, exc)
+            self._db = None
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = self._load(key)
+            images, stored = self._data[key]
+        if stored < time.time() - self._max_age:
+            raise KeyError(key)
+        return images
+
+    def __setitem__(self, key, images):
+        stored = time.time()
+        with self._lock:
+            self._data[key] = (images, stored)
+            self._execute(
+                'INSERT OR REPLACE INTO images VALUES (?, ?, ?)',
+                (_encode_key(key), _encode_images(images), stored))
+
+    def update(self, *args, **kwargs):
+        # Each commit waits for the disk, so store all entries in a single
+        # transaction instead of one per entry.
+        entries = dict(*args, **kwargs)
+        stored = time.time()
+        with self._lock:
+            for key, images in entries.items():
+                self._data[key] = (images, stored)
+            self._execute_many(
+                'INSERT OR REPLACE INTO images VALUES (?, ?, ?)', [
+                    (_encode_key(key), _encode_images(images), stored)
+                    for key, images in entries.items()])
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._execute(
+                'DELETE FROM images WHERE key = ?', (_encode_key(key),))
+
+    def __iter__(self):
+        min_stored = time.time() - self._max_age
+        with self._lock:
+            keys = {
+                key for key, (_, stored) in self._data.items()
+                if stored >= min_stored}
+            rows = self._execute(
+                'SELECT key FROM images WHERE stored >= ?', (min_stored,))
+        keys.update(_decode_key(row[0]) for row in rows)
+        return iter(keys)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def _load(self, key):
+        rows = self._execute(
+            'SELECT images, stored FROM images WHERE key = ?',
+            (_encode_key(key),))
+        if not rows:
+            raise KeyError(key)
+        return _decode_images(rows[0][0]), rows[0][1]
+
+    def _execute(self, sql, parameters):
+        if self._db is None:
+            return []
+        try:
+            with self._db:
+                return self._db.execute(sql, parameters).fetchall()
+        except sqlite3.Error as exc:
+            logger.warning('Image cache query failed: %s', exc)
+            return []
+
+    def _execute_many(self, sql, seq_of_parameters):
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.executemany(sql, seq_of_parameters)
+        except sqlite3.Error as exc:
+            logger.warning('Image cache query failed: %s', exc)
+
+
+def _encode_key(key):
+    return '%s:%s' % key
+
+
+def _decode_key(value):
+    return tuple(value.split(':', 1))
+
+
+def _encode_images(images):
+    return json.dumps([
+        [image.uri, image.width, image.height] for image in images])
+
+
+def _decode_images(value):
+    return tuple(
+        models.Image(uri=uri, width=width, height=height)
+        for uri, width, height in json.loads(value))
@@ -33,6 +33,11 @@ class SpotifyLibraryProvider(backend.LibraryProvider):
             self._config, self._backend._session, self._backend._web_client,
             uri)
 
+    def lookup_many(self, uris):
+        return lookup.lookup_many(
+            self._config, self._backend._session, self._backend._web_client,
+            uris)
+
     def search(self, query=None, uris=None, exact=False):
         return search.search(
             self._config, self._backend._session, self._backend._web_client,
@@ -1,6 +1,8 @@
 from __future__ import unicode_literals
 
 import logging
+import time
+import urllib
 
 import spotify
 
@@ -13,6 +15,9 @@ _VARIOUS_ARTISTS_URIS = [
     'spotify:artist:0LyfQWJT6nXafLPZqxe9Of',
 ]
 
+_API_MAX_IDS_PER_REQUEST = 50
+_API_MAX_ALBUM_IDS_PER_REQUEST = 20
+
 
 def lookup(config, session, web_client, uri):
     try:
@@ -23,6 +28,14 @@ def lookup(config, session, web_client, uri):
         logger.info('Failed to lookup "%s": %s', uri, exc)
         return []
 
+    if web_link.type == 'artist' and config['web_artist_lookup']:
+        with utils.time_logger('Web artist lookup'):
+            tracks = list(_lookup_web_artist(config, web_client, web_link))
+        if tracks:
+            return tracks
+        logger.debug(
+            'Web API artist lookup of "%s" failed, trying libspotify', uri)
+
     try:
         if web_link.type == 'playlist':
             return _lookup_playlist(config, session, web_client, uri)
@@ -43,6 +56,50 @@ def lookup(config, session, web_client, uri):
         return []
 
 
+def lookup_many(config, session, web_client, uris):
+    result = {}
+    web_links = []
+    for uri in uris:
+        try:
+            web_link = web.parse_uri(uri)
+        except ValueError:
+            web_link = None
+        if web_link is not None and web_link.type == 'track':
+            web_links.append(web_link)
+        else:
+            result[uri] = lookup(config, session, web_client, uri)
+
+    # Fetch tracks from the Web API in batches instead of loading them one at
+    # a time through libspotify.
+    for i in range(0, len(web_links), _API_MAX_IDS_PER_REQUEST):
+        batch = web_links[i:i + _API_MAX_IDS_PER_REQUEST]
+        result.update(_lookup_web_tracks(config, web_client, batch))
+
+    # Fall back to libspotify for any tracks the Web API didn't return.
+    for web_link in web_links:
+        if web_link.uri not in result:
+            result[web_link.uri] = lookup(
+                config, session, web_client, web_link.uri)
+
+    return result
+
+
+def _lookup_web_tracks(config, web_client, web_links):
+    result = {}
+    data = web_client.get('tracks', params={
+        'ids': ','.join(web_link.id for web_link in web_links),
+        'market': 'from_token'})
+
+    # Tracks are returned in the order requested, with null for unknown IDs.
+    for web_link, web_track in zip(web_links, data.get('tracks', [])):
+        if not web_track:
+            continue
+        track = translator.web_to_track(web_track, bitrate=config['bitrate'])
+        if track is not None:
+            result[web_link.uri] = [track]
+    return result
+
+
 def _lookup_track(config, sp_link):
     sp_track = sp_link.as_track()
     sp_track.load(config['timeout'])
@@ -68,11 +125,16 @@ def _lookup_artist(config, sp_link):
         type=spotify.ArtistBrowserType.NO_TRACKS)
     sp_artist_browser.load(config['timeout'])
 
-    # Get all album browsers we need first, so they can start retrieving
-    # data in the background.
+    # The albums load in the background, and the album browsers start
+    # retrieving data in the background as soon as they are created. Wait for
+    # all of them with a single deadline, so the lookup takes about as long as
+    # the slowest album instead of the sum of all albums.
+    deadline = time.time() + config['timeout']
+
     sp_album_browsers = []
     for sp_album in sp_artist_browser.albums:
-        sp_album.load(config['timeout'])
+        if not _load_before(sp_album, deadline):
+            continue
         if not sp_album.is_available:
             continue
         if sp_album.type is spotify.AlbumType.COMPILATION:
@@ -82,7 +144,8 @@ def _lookup_artist(config, sp_link):
         sp_album_browsers.append(sp_album.browse())
 
     for sp_album_browser in sp_album_browsers:
-        sp_album_browser.load(config['timeout'])
+        if not _load_before(sp_album_browser, deadline):
+            continue
         for sp_track in sp_album_browser.tracks:
             track = translator.to_track(
                 sp_track, bitrate=config['bitrate'])
@@ -90,6 +153,82 @@ def _lookup_artist(config, sp_link):
                 yield track
 
 
+def _load_before(sp_obj, deadline):
+    try:
+        sp_obj.load(max(deadline - time.time(), 0))
+    except spotify.Timeout:
+        logger.debug('Timed out loading %r for artist lookup', sp_obj)
+        return False
+    return True
+
+
+def _lookup_web_artist(config, web_client, web_link):
+    # As with libspotify, give up on anything that isn't fetched within a
+    # single timeout for the whole artist.
+    deadline = time.time() + config['timeout']
+
+    web_album_ids = []
+    pages = web_client.get_all(
+        'artists/%s/albums' % web_link.id, params={
+            'include_groups': 'album,single',
+            'market': 'from_token',
+            'limit': 50})
+    for page in pages:
+        for web_album in page.get('items', []):
+            if web_album.get('album_type') == 'compilation':
+                continue
+            web_artists = web_album.get('artists') or [{}]
+            if web_artists[0].get('uri') in _VARIOUS_ARTISTS_URIS:
+                continue
+            web_album_ids.append(web_album['id'])
+        if time.time() > deadline:
+            logger.debug('Timed out fetching albums of %s', web_link.uri)
+            break
+
+    paths = []
+    for i in range(0, len(web_album_ids), _API_MAX_ALBUM_IDS_PER_REQUEST):
+        batch = web_album_ids[i:i + _API_MAX_ALBUM_IDS_PER_REQUEST]
+        paths.append('albums?%s' % urllib.urlencode(sorted({
+            'ids': ','.join(batch),
+            'market': 'from_token'}.items())))
+    web_albums = []
+    if paths:
+        for data in web_client.get_many(paths):
+            web_albums += [
+                web_album for web_album in data.get('albums', []) if web_album]
+
+    for web_album, web_tracks in _get_web_album_tracks(
+            web_client, web_albums, deadline):
+        for web_track in web_tracks:
+            # Album tracks don't include the album they belong to.
+            track = translator.web_to_track(
+                dict(web_track, album=web_album), bitrate=config['bitrate'])
+            if track is not None:
+                yield track
+
+
+def _get_web_album_tracks(web_client, web_albums, deadline):
+    # Albums include their first page of tracks. Fetch the next page of all
+    # albums with more tracks at once, and any further pages one at a time.
+    next_urls = [
+        web_album['tracks']['next'] for web_album in web_albums
+        if web_album.get('tracks', {}).get('next')]
+    next_pages = {}
+    if next_urls and time.time() < deadline:
+        next_pages = dict(zip(next_urls, web_client.get_many(next_urls)))
+
+    for web_album in web_albums:
+        page = web_album.get('tracks', {})
+        web_tracks = list(page.get('items', []))
+        page = next_pages.get(page.get('next'))
+        while page:
+            web_tracks += page.get('items', [])
+            if not page.get('next') or time.time() > deadline:
+                break
+            page = web_client.get(page['next'])
+        yield web_album, web_tracks
+
+
 def _lookup_playlist(config, session, web_client, uri):
     playlist = playlists.playlist_lookup(
         session, web_client, uri, config['bitrate'])
@@ -1,11 +1,17 @@
 from __future__ import unicode_literals
 
+import bisect
+import collections
+import contextlib
 import functools
 import logging
 import threading
+import time
 
 from mopidy import audio, backend
 
+import pykka
+
 import spotify
 
 
@@ -18,6 +24,21 @@ GST_CAPS = 'audio/x-raw,format=S16LE,rate=44100,channels=2,layout=interleaved'
 # Extra log level with lower importance than DEBUG=10 for noisy debug logging
 TRACE_LOG_LEVEL = 5
 
+# Number of audio buffers that may be waiting to be pushed to the audio actor.
+# libspotify usually delivers 2048 frames, or about 46 ms of audio, at a time.
+BUFFER_QUEUE_SIZE = 32
+
+# Seconds to wait before pushing a buffer again if the audio actor rejected it,
+# e.g. because the new appsrc isn't set up yet when changing track.
+BUFFER_RETRY_INTERVAL = 0.05
+
+# Seconds between debug logging of the playback statistics while playing.
+STATS_LOG_INTERVAL = 60
+
+# Seconds after a seek during which further seeks are collapsed into one, e.g.
+# while the user drags a progress bar.
+SEEK_COALESCE_WINDOW = 0.1
+
 
 class SpotifyPlaybackProvider(backend.PlaybackProvider):
 
@@ -25,24 +46,32 @@ class SpotifyPlaybackProvider(backend.PlaybackProvider):
         super(SpotifyPlaybackProvider, self).__init__(*args, **kwargs)
         self._timeout = self.backend._config['spotify']['timeout']
 
+        self.stats = PlaybackStats()
         self._buffer_timestamp = BufferTimestamp(0)
         self._seeking_event = threading.Event()
         self._first_seek = False
         self._push_audio_data_event = threading.Event()
         self._push_audio_data_event.set()
         self._end_of_track_event = threading.Event()
+        self._buffer_queue = BufferQueue(
+            self.audio, BUFFER_QUEUE_SIZE, self._buffer_timestamp, self.stats)
+        self._seek_coalescer = SeekCoalescer(
+            self._forward_seek, SEEK_COALESCE_WINDOW, self.stats)
+        self._prefetched = None
+        self._prefetch_thread = None
         self._events_connected = False
 
     def _connect_events(self):
         if not self._events_connected:
             self._events_connected = True
+            self._buffer_queue.start()
             self.backend._session.on(
                 spotify.SessionEvent.MUSIC_DELIVERY, music_delivery_callback,
-                self.audio, self._seeking_event, self._push_audio_data_event,
-                self._buffer_timestamp)
+                self._buffer_queue, self._seeking_event,
+                self._push_audio_data_event, self.stats, self._seek_coalescer)
             self.backend._session.on(
                 spotify.SessionEvent.END_OF_TRACK, end_of_track_callback,
-                self._end_of_track_event, self.audio)
+                self._end_of_track_event, self._buffer_queue)
 
     def change_track(self, track):
         self._connect_events()
@@ -50,6 +79,10 @@ class SpotifyPlaybackProvider(backend.PlaybackProvider):
         if track.uri is None:
             return False
 
+        with self.stats.timed('change_track'):
+            return self._change_track(track)
+
+    def _change_track(self, track):
         logger.debug(
             'Audio requested change of track; '
             'loading and starting Spotify player')
@@ -60,15 +93,24 @@ class SpotifyPlaybackProvider(backend.PlaybackProvider):
             enough_data_callback, self._push_audio_data_event)
 
         seek_data_callback_bound = functools.partial(
-            seek_data_callback, self._seeking_event, self.backend._actor_proxy)
-
+            seek_data_callback, self._seeking_event, self._buffer_queue,
+            self._seek_coalescer, self.stats)
+
+        # Let the end of the previous track reach the audio actor before
+        # audio from the new track is queued behind it.
+        if not self._buffer_queue.wait_until_empty(self._timeout):
+            dropped = self._buffer_queue.clear()
+            logger.debug(
+                'Timed out pushing the end of the previous track; '
+                'dropped %d buffers', dropped)
+
+        self._seek_coalescer.cancel()
         self._buffer_timestamp.set(0)
         self._first_seek = True
         self._end_of_track_event.clear()
 
         try:
-            sp_track = self.backend._session.get_track(track.uri)
-            sp_track.load(self._timeout)
+            sp_track = self._get_track(track.uri)
             self.backend._session.player.load(sp_track)
             self.backend._session.player.play()
 
@@ -88,6 +130,49 @@ class SpotifyPlaybackProvider(backend.PlaybackProvider):
             logger.info('Playback of %s failed: %s', track.uri, exc)
             return False
 
+    def prefetch(self, track):
+        # Called by the frontend when the next track is known, so that it is
+        # ready by the time the audio layer asks for it.
+        if track.uri is None:
+            return
+        if self._prefetched is not None and self._prefetched[0] == track.uri:
+            return
+
+        try:
+            sp_track = self.backend._session.get_track(track.uri)
+        except spotify.Error as exc:
+            logger.debug('Prefetching %s failed: %s', track.uri, exc)
+            return
+        self._prefetched = (track.uri, sp_track)
+
+        # Loading the track can take up to the timeout, so do it in another
+        # thread to keep the backend actor free for the current track.
+        self._prefetch_thread = threading.Thread(
+            target=self._load_prefetched, args=(track.uri, sp_track),
+            name='SpotifyPrefetcher')
+        self._prefetch_thread.daemon = True
+        self._prefetch_thread.start()
+
+    def _load_prefetched(self, uri, sp_track):
+        # Called from a helper thread, and not in an actor context.
+        try:
+            sp_track.load(self._timeout)
+            self.backend._session.player.prefetch(sp_track)
+        except spotify.Error as exc:
+            logger.debug('Prefetching %s failed: %s', uri, exc)
+            return
+        logger.debug('Prefetched %s', uri)
+
+    def _get_track(self, uri):
+        prefetched_uri, sp_track = self._prefetched or (None, None)
+        self._prefetched = None
+
+        if uri != prefetched_uri:
+            sp_track = self.backend._session.get_track(uri)
+        # Returns right away if the prefetched track has finished loading.
+        sp_track.load(self._timeout)
+        return sp_track
+
     def resume(self):
         logger.debug('Audio requested resume; starting Spotify player')
         self.backend._session.player.play()
@@ -96,6 +181,7 @@ class SpotifyPlaybackProvider(backend.PlaybackProvider):
     def stop(self):
         logger.debug('Audio requested stop; pausing Spotify player')
         self.backend._session.player.pause()
+        self._buffer_queue.clear()
         return super(SpotifyPlaybackProvider, self).stop()
 
     def pause(self):
@@ -103,17 +189,32 @@ class SpotifyPlaybackProvider(backend.PlaybackProvider):
         self.backend._session.player.pause()
         return super(SpotifyPlaybackProvider, self).pause()
 
-    def on_seek_data(self, time_position):
+    def _forward_seek(self, time_position, generation):
+        # Called by the seek coalescer from GStreamer's or its own thread.
+        self.backend._actor_proxy.playback.on_seek_data(
+            time_position, generation)
+
+    def on_seek_data(self, time_position, generation=None):
         logger.debug('Audio requested seek to %d', time_position)
 
         if time_position == 0 and self._first_seek:
-            self._seeking_event.clear()
+            if self._seek_coalescer.skip(generation):
+                self._seeking_event.clear()
             self._first_seek = False
             logger.debug('Skipping seek due to issue mopidy/mopidy#300')
             return
 
+        # libspotify may have confirmed an earlier seek since this one was
+        # requested, so make sure audio is dropped until this one completes.
+        self._seeking_event.set()
+        dropped = self._buffer_queue.clear()
+        logger.log(
+            TRACE_LOG_LEVEL, 'Dropped %d queued buffers due to seek', dropped)
+
         self._buffer_timestamp.set(
             audio.millisecond_to_clocktime(time_position))
+        self.stats.start_timer('seek')
+        self._seek_coalescer.issue(generation)
         self.backend._session.player.seek(time_position)
 
 
@@ -133,16 +234,20 @@ def enough_data_callback(push_audio_data_event):
     push_audio_data_event.clear()
 
 
-def seek_data_callback(seeking_event, spotify_backend, time_position):
+def seek_data_callback(
+        seeking_event, buffer_queue, seek_coalescer, stats, time_position):
     # This callback is called from GStreamer/the GObject event loop.
-    # It forwards the call to the backend actor.
+    # It forwards the call to the backend actor through the seek coalescer.
     seeking_event.set()
-    spotify_backend.playback.on_seek_data(time_position)
+    buffer_queue.clear()  # Don't push any more audio from before the seek.
+    stats.start_timer('seek_to_audio')
+    seek_coalescer.seek(time_position)
 
 
 def music_delivery_callback(
         session, audio_format, frames, num_frames,
-        audio_actor, seeking_event, push_audio_data_event, buffer_timestamp):
+        buffer_queue, seeking_event, push_audio_data_event, stats,
+        seek_coalescer):
     # This is called from an internal libspotify thread.
     # Ideally, nothing here should block.
 
@@ -150,12 +255,18 @@ def music_delivery_callback(
         # A seek has happened, but libspotify hasn't confirmed yet, so
         # we're dropping all audio data from libspotify.
         if num_frames == 0:
-            # libspotify signals that it has completed the seek. We'll accept
-            # the next audio data delivery.
-            seeking_event.clear()
+            # libspotify signals that it has completed a seek. We'll accept
+            # the next audio data delivery, unless a later seek is still
+            # held back or waiting to be confirmed.
+            if seek_coalescer.confirm():
+                seeking_event.clear()
+                stats.stop_timer('seek')
+        else:
+            stats.count_delivery('deliveries_dropped_while_seeking')
         return num_frames
 
     if not push_audio_data_event.is_set():
+        stats.count_delivery('deliveries_rejected')
         return 0  # Reject the audio data. It will be redelivered later.
 
     if not frames:
@@ -166,20 +277,22 @@ def music_delivery_callback(
     assert known_format, 'Expects 16-bit signed integer samples'
 
     duration = audio.calculate_duration(num_frames, audio_format.sample_rate)
-    buffer_ = audio.create_buffer(
-        bytes(frames), timestamp=buffer_timestamp.get(), duration=duration)
 
-    # We must block here to know if the buffer was consumed successfully.
-    consumed = audio_actor.emit_data(buffer_).get()
-
-    if consumed:
-        buffer_timestamp.increase(duration)
+    # The buffer is created and pushed to the audio actor from another thread,
+    # so we don't have to wait for the audio actor here.
+    if buffer_queue.put((bytes(frames), duration)):
+        stats.count_delivery('deliveries')
+        seek_latency = stats.stop_timer('seek_to_audio')
+        if seek_latency is not None:
+            logger.debug(
+                'First audio after seek queued in %dms', seek_latency * 1000)
         return num_frames
     else:
-        return 0
+        stats.count_delivery('deliveries_queue_full')
+        return 0  # The queue is full. The data will be redelivered later.
 
 
-def end_of_track_callback(session, end_of_track_event, audio_actor):
+def end_of_track_callback(session, end_of_track_event, buffer_queue):
     # This callback is called from the pyspotify event loop.
 
     if end_of_track_event.is_set():
@@ -188,28 +301,377 @@ def end_of_track_callback(session, end_of_track_event, audio_actor):
 
     logger.debug('End of track reached')
     end_of_track_event.set()
-    audio_actor.emit_data(None)
+    buffer_queue.put_end_of_track()
 
 
 class BufferTimestamp(object):
-    """Wrapper around an int to serialize access by multiple threads.
-
-    The value is used both from the backend actor and callbacks called by
-    internal libspotify threads.
+    """Timestamp of the next audio buffer, shared by multiple threads.
+
+    :meth:`set` is called from the backend actor when changing track or
+    seeking, while :meth:`get` and :meth:`increase` are called for every audio
+    buffer by the :class:`BufferQueue` thread. To keep pushing buffers cheap,
+    no lock is used. Instead, each attribute has a single writer: :meth:`set`
+    replaces the base timestamp, and the pushing thread keeps the offset from
+    it, which it resets whenever it sees a new base.
     """
 
     def __init__(self, value):
-        self._value = value
-        self._lock = threading.RLock()
+        self._base = (value,)
+        self._seen_base = self._base
+        self._offset = 0
 
     def get(self):
-        with self._lock:
-            return self._value
+        return self._get_base() + self._offset
 
     def set(self, value):
-        with self._lock:
-            self._value = value
+        # Always a new tuple, so the delivery thread notices the change even
+        # if the value is the same as before.
+        self._base = (value,)
 
     def increase(self, value):
+        self._get_base()
+        self._offset += value
+
+    def _get_base(self):
+        base = self._base
+        if base is not self._seen_base:
+            self._seen_base = base
+            self._offset = 0
+        return base[0]
+
+
+class BufferQueue(object):
+    """Bounded queue of audio data waiting to be pushed to the audio actor.
+
+    Audio data is put in the queue as ``(data, duration)`` by callbacks called
+    by internal libspotify threads, and pushed to the audio actor one buffer
+    at a time by a separate thread, so that libspotify never has to wait for
+    the audio actor. The buffers are timestamped with ``buffer_timestamp`` as
+    they are pushed, and a buffer rejected by the audio actor is kept at the
+    head of the queue and pushed again after ``retry_interval`` seconds.
+    """
+
+    def __init__(
+            self, audio_actor, max_size, buffer_timestamp, stats,
+            retry_interval=BUFFER_RETRY_INTERVAL):
+        self._audio_actor = audio_actor
+        self._max_size = max_size
+        self._buffer_timestamp = buffer_timestamp
+        self._stats = stats
+        self._retry_interval = retry_interval
+        self._buffers = collections.deque()
+        self._clear_count = 0
+        self._pushing = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='SpotifyAudioPusher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def put(self, audio_data):
+        with self._condition:
+            if len(self._buffers) >= self._max_size:
+                return False
+            self._buffers.append(audio_data)
+            self._condition.notify_all()
+            return True
+
+    def put_end_of_track(self):
+        # The end of track marker must not be lost, so it ignores the bound.
+        with self._condition:
+            self._buffers.append(None)
+            self._condition.notify_all()
+
+    def clear(self):
+        with self._condition:
+            count = len(self._buffers)
+            self._buffers.clear()
+            self._clear_count += 1
+            self._condition.notify_all()
+            return count
+
+    def wait_until_empty(self, timeout):
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._buffers or self._pushing:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def __len__(self):
+        with self._condition:
+            return len(self._buffers)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._buffers:
+                    self._condition.wait()
+                audio_data = self._buffers[0]
+                clear_count = self._clear_count
+                self._pushing = True
+
+            try:
+                with self._stats.timed('emit_data'):
+                    consumed = self._push(audio_data)
+            except pykka.ActorDeadError:
+                logger.debug('Audio actor is gone; dropping buffer')
+                consumed = True
+            self._stats.maybe_log()
+
+            with self._condition:
+                self._pushing = False
+                if clear_count == self._clear_count:
+                    # The end of track marker isn't retried, as before.
+                    if consumed or audio_data is None:
+                        self._buffers.popleft()
+                        if audio_data is not None:
+                            self._buffer_timestamp.increase(audio_data[1])
+                    else:
+                        self._stats.increment('buffers_rejected')
+                        logger.log(
+                            TRACE_LOG_LEVEL,
+                            'Audio rejected buffer; retrying in %dms',
+                            self._retry_interval * 1000)
+                        self._condition.wait(self._retry_interval)
+                self._condition.notify_all()
+
+    def _push(self, audio_data):
+        if audio_data is None:
+            return self._audio_actor.emit_data(None).get()
+        data, duration = audio_data
+        buffer_ = audio.create_buffer(
+            data, timestamp=self._buffer_timestamp.get(), duration=duration)
+        return self._audio_actor.emit_data(buffer_).get()
+
+
+class PlaybackStats(object):
+    """Thread-safe counters and latency histograms of the audio pipeline.
+
+    Events are counted with :meth:`increment`, or with :meth:`count_delivery`
+    from the libspotify delivery thread. Latencies are recorded with
+    :meth:`timed`, :meth:`record`, or by pairing :meth:`start_timer` and
+    :meth:`stop_timer`. :attr:`stats` returns a snapshot of everything
+    recorded so far, and :meth:`maybe_log` logs it every ``log_interval``
+    seconds.
+    """
+
+    # Counters only written by the libspotify delivery thread.
+    DELIVERY_COUNTERS = (
+        'deliveries',
+        'deliveries_dropped_while_seeking',
+        'deliveries_queue_full',
+        'deliveries_rejected',
+    )
+
+    # Upper bounds in milliseconds of the latency histogram buckets. Slower
+    # events are counted in an extra, unbounded bucket.
+    LATENCY_BUCKETS = (1, 5, 10, 50, 100, 500, 1000)
+
+    def __init__(self, log_interval=STATS_LOG_INTERVAL, clock=time.time):
+        self._log_interval = log_interval
+        self._clock = clock
+        self._counters = collections.Counter()
+        self._delivery_counters = dict.fromkeys(self.DELIVERY_COUNTERS, 0)
+        self._latencies = {}
+        self._timers = {}
+        self._last_logged = clock()
+        self._lock = threading.Lock()
+
+    def increment(self, name, count=1):
+        with self._lock:
+            self._counters[name] += count
+
+    def count_delivery(self, name):
+        # Called for every audio delivery. There is a single writer and the
+        # keys never change, so no lock is needed.
+        self._delivery_counters[name] += 1
+
+    def record(self, name, seconds):
+        milliseconds = seconds * 1000
+        with self._lock:
+            latency = self._latencies.get(name)
+            if latency is None:
+                latency = self._latencies[name] = {
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'buckets': [0] * (len(self.LATENCY_BUCKETS) + 1),
+                }
+            latency['count'] += 1
+            latency['total_ms'] += milliseconds
+            latency['max_ms'] = max(latency['max_ms'], milliseconds)
+            bucket = bisect.bisect_left(self.LATENCY_BUCKETS, milliseconds)
+            latency['buckets'][bucket] += 1
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, self._clock() - start)
+
+    def start_timer(self, name):
+        with self._lock:
+            self._timers[name] = self._clock()
+
+    def stop_timer(self, name):
+        """Record the seconds since the timer was started, and return them.
+
+        Returns :class:`None` if the timer isn't running.
+        """
+        if name not in self._timers:
+            return None  # Cheap check for calls on every audio delivery.
+        with self._lock:
+            start = self._timers.pop(name, None)
+        if start is None:
+            return None
+        seconds = self._clock() - start
+        self.record(name, seconds)
+        return seconds
+
+    @property
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters.update(
+                (name, count)
+                for name, count in self._delivery_counters.items() if count)
+            return {
+                'counters': counters,
+                'latencies': dict(
+                    (name, self._summarize(latency))
+                    for name, latency in self._latencies.items()),
+            }
+
+    def _summarize(self, latency):
+        labels = ['<=%dms' % bound for bound in self.LATENCY_BUCKETS]
+        labels.append('>%dms' % self.LATENCY_BUCKETS[-1])
+        return {
+            'count': latency['count'],
+            'mean_ms': latency['total_ms'] / latency['count'],
+            'max_ms': latency['max_ms'],
+            'histogram': dict(zip(labels, latency['buckets'])),
+        }
+
+    def maybe_log(self):
+        """Log the stats if ``log_interval`` has passed since last time."""
+        now = self._clock()
+        if now - self._last_logged < self._log_interval:
+            return
+        with self._lock:
+            if now - self._last_logged < self._log_interval:
+                return
+            self._last_logged = now
+        logger.debug('Spotify playback stats: %r', self.stats)
+
+
+class SeekCoalescer(object):
+    """Collapses bursts of seeks into as few Spotify seeks as possible.
+
+    The first seek is forwarded right away. Seeks requested within ``window``
+    seconds of a forwarded seek are held back, and only the latest of them is
+    forwarded when the window ends. The ``timer`` factory can be replaced for
+    testing.
+
+    Each requested seek gets a new generation number, which is forwarded
+    along with the position. Audio must be dropped until the seek with the
+    latest generation has been issued to libspotify and libspotify has
+    confirmed a seek after that, as checked by :meth:`confirm`.
+    """
+
+    def __init__(self, seek, window, stats, timer=threading.Timer):
+        self._seek = seek
+        self._window = window
+        self._stats = stats
+        self._timer_factory = timer
+        self._timer = None
+        self._window_id = 0
+        self._pending = None
+        self._latest = 0
+        self._last_issued = 0
+        self._lock = threading.Lock()
+
+    def seek(self, time_position):
+        with self._lock:
+            self._latest += 1
+            seek = (time_position, self._latest)
+            if self._timer is not None:
+                if self._pending is not None:
+                    self._stats.increment('seeks_coalesced')
+                self._pending = seek
+                return
+            self._start_window()
+        self._stats.increment('seeks')
+        self._seek(*seek)
+
+    def issue(self, generation):
+        """Called when a forwarded seek is passed on to libspotify."""
+        with self._lock:
+            generation = self._get_generation(generation)
+            self._last_issued = max(self._last_issued, generation)
+
+    def skip(self, generation):
+        """Called when a forwarded seek is skipped.
+
+        Returns :class:`True` if no later seek is outstanding.
+        """
+        with self._lock:
+            generation = self._get_generation(generation)
+            self._last_issued = max(self._last_issued, generation)
+            return self._is_settled()
+
+    def confirm(self):
+        """Called when libspotify has completed a seek.
+
+        libspotify may flush only once for several seeks issued close
+        together, so this confirms every seek issued so far. Returns
+        :class:`True` if no later seek is held back or yet to be issued.
+        """
+        with self._lock:
+            return self._is_settled()
+
+    def cancel(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._pending = None
+            self._last_issued = self._latest
+
+    def _get_generation(self, generation):
+        # Seeks that didn't come through the coalescer count as the latest.
+        return self._latest if generation is None else generation
+
+    def _is_settled(self):
+        return self._last_issued >= self._latest
+
+    def _start_window(self):
+        self._window_id += 1
+        self._timer = self._timer_factory(
+            self._window, self._on_window_end, [self._window_id])
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_window_end(self, window_id):
         with self._lock:
-            self._value += value
+            if window_id != self._window_id or self._timer is None:
+                return  # The window was cancelled.
+            seek = self._pending
+            self._pending = None
+            if seek is None:
+                self._timer = None
+                return
+            # Keep holding back seeks for as long as they keep coming.
+            self._start_window()
+        self._stats.increment('seeks')
+        self._seek(*seek)
@@ -1,16 +1,18 @@
 from __future__ import unicode_literals
 
 import logging
+from multiprocessing.pool import ThreadPool
 
 from mopidy import backend
 
 import spotify
 
-from mopidy_spotify import translator, utils
+from mopidy_spotify import images, translator, utils, web
 
 
-_cache = {}
+_cache = web.WebResponseCache()
 _sp_links = {}
+_snapshot_ids = {}  # Playlist URI -> snapshot ID from latest playlists list
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +22,20 @@ class SpotifyPlaylistsProvider(backend.PlaylistsProvider):
     def __init__(self, backend):
         self._backend = backend
         self._timeout = self._backend._config['spotify']['timeout']
+        self._refresh_concurrency = (
+            self._backend._config['spotify']['playlist_refresh_concurrency'])
         self._loaded = False
+        self._playlist_refs = []  # Playlists found by the latest refresh
+        self._refreshed_uris = set()
 
     def as_list(self):
         with utils.time_logger('playlists.as_list()', logging.INFO):
             if not self._loaded:
-                return []
+                # Serve the playlists loaded so far while the first refresh
+                # is still running, without listing the playlists again.
+                return [
+                    ref for ref in self._playlist_refs
+                    if ref.uri in self._refreshed_uris]
 
             return list(self._get_flattened_playlist_refs())
 
@@ -38,6 +48,9 @@ class SpotifyPlaylistsProvider(backend.PlaylistsProvider):
 
         web_client = self._backend._web_client
         for web_playlist in web_client.get_user_playlists(_cache):
+            if web_playlist.get('uri'):
+                _snapshot_ids[web_playlist['uri']] = (
+                    web_playlist.get('snapshot_id'))
             playlist_ref = translator.to_playlist_ref(
                 web_playlist, web_client.user_id)
             if playlist_ref is not None:
@@ -45,7 +58,7 @@ class SpotifyPlaylistsProvider(backend.PlaylistsProvider):
 
     def get_items(self, uri):
         with utils.time_logger('playlist.get_items(%s)' % uri, logging.INFO):
-            if not self._loaded:
+            if not self._loaded and uri not in self._refreshed_uris:
                 return []
 
             return self._get_playlist(uri, as_items=True)
@@ -61,17 +74,43 @@ class SpotifyPlaylistsProvider(backend.PlaylistsProvider):
 
     def refresh(self):
         with utils.time_logger('Refresh Playlists', logging.INFO):
-            _cache.clear()
+            # Force revalidation of cached responses rather than dropping
+            # them. Playlists whose snapshot ID is unchanged are then served
+            # from the cache without any requests at all.
+            _cache.expire()
             _sp_links.clear()
+            _snapshot_ids.clear()
             # Want libspotify to get track links so they load in the background
-            count = 0
-            playlists = self._get_flattened_playlist_refs()
-            for count, playlist_ref in enumerate(playlists, start=1):
-                self._get_playlist(playlist_ref.uri)
-            logger.info('Refreshed %d playlists', count)
+            self._playlist_refs = list(self._get_flattened_playlist_refs())
+            uris = [ref.uri for ref in self._playlist_refs]
+            self._refresh_playlists(uris)
+            logger.info('Refreshed %d playlists', len(uris))
 
         self._loaded = True
 
+    def _refresh_playlists(self, uris):
+        if not uris:
+            return
+
+        # Report progress about every tenth of the playlists.
+        step = max(len(uris) // 10, 1)
+        pool = ThreadPool(min(self._refresh_concurrency, len(uris)))
+        try:
+            results = pool.imap_unordered(self._refresh_playlist, uris)
+            for count, uri in enumerate(results, start=1):
+                self._refreshed_uris.add(uri)
+                if count % step == 0 or count == len(uris):
+                    logger.info(
+                        'Refreshing playlists: %d of %d done',
+                        count, len(uris))
+        finally:
+            pool.close()
+            pool.join()
+
+    def _refresh_playlist(self, uri):
+        self._get_playlist(uri)
+        return uri
+
     def create(self, name):
         pass  # TODO
 
@@ -87,12 +126,17 @@ def playlist_lookup(session, web_client, uri, bitrate, as_items=False):
         return
 
     logger.debug('Fetching Spotify playlist "%s"', uri)
-    web_playlist = web_client.get_playlist(uri, _cache)
+    web_playlist = web_client.get_playlist(
+        uri, _cache, snapshot_id=_snapshot_ids.get(uri))
 
     if web_playlist == {}:
         logger.error('Failed to lookup Spotify playlist URI %s', uri)
         return
 
+    images.add_track_albums(
+        item.get('track') for item in
+        web_playlist.get('tracks', {}).get('items', []))
+
     playlist = translator.to_playlist(
             web_playlist, username=web_client.user_id, bitrate=bitrate,
             as_items=as_items)
@@ -118,7 +162,8 @@ def playlist_lookup(session, web_client, uri, bitrate, as_items=False):
 
 
 def on_playlists_loaded():
-    # Called from the pyspotify event loop, and not in an actor context.
+    # Called from the pyspotify event loop or the backend's background loader,
+    # and not in an actor context.
     logger.debug('Spotify playlists loaded')
 
     # This event listener is also called after playlists are added, removed and
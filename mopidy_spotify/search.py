@@ -1,17 +1,25 @@
 from __future__ import unicode_literals
 
 import logging
+import multiprocessing
+import time
 import urllib
 
 from mopidy import models
 
 import spotify
 
-from mopidy_spotify import lookup, translator
+from mopidy_spotify import images, lookup, translator, utils
 
 
 _SEARCH_TYPES = ['album', 'artist', 'track']
 
+_API_MAX_SEARCH_LIMIT = 50
+
+# Search responses are only reused while their Cache-Control header allows it.
+# The TTL just bounds how long stale responses are kept for revalidation.
+_cache = utils.LRUCache(max_entries=1000, ttl=3600)
+
 logger = logging.getLogger(__name__)
 
 
@@ -43,44 +51,103 @@ def search(config, session, web_client,
         config['search_album_count'],
         config['search_artist_count'],
         config['search_track_count'])
-
-    if search_count > 50:
-        logger.warn(
-            'Spotify currently allows maximum 50 search results of each type. '
-            'Please set the config values spotify/search_album_count, '
-            'spotify/search_artist_count and spotify/search_track_count '
-            'to at most 50.')
-        search_count = 50
-
-    result = web_client.get('search', params={
-        'q': sp_query,
-        'limit': search_count,
-        'market': 'from_token',
-        'type': ','.join(types)})
+    search_limit = min(search_count, _API_MAX_SEARCH_LIMIT)
+
+    if config['search_per_type'] and len(types) > 1:
+        result = _search_per_type(
+            config, web_client, sp_query, types, search_limit)
+    else:
+        result = web_client.get('search', _cache, params={
+            'q': sp_query,
+            'limit': search_limit,
+            'market': 'from_token',
+            'type': ','.join(types)})
+
+    items = _get_search_items(
+        config, web_client, sp_query, types, result, search_limit)
+    images.add_track_albums(items.get('track', []))
 
     albums = [
         translator.web_to_album(web_album) for web_album in
-        result['albums']['items'][:config['search_album_count']]
-    ] if 'albums' in result else []
+        items.get('album', [])[:config['search_album_count']]
+    ]
 
     artists = [
         translator.web_to_artist(web_artist) for web_artist in
-        result['artists']['items'][:config['search_artist_count']]
-    ] if 'artists' in result else []
+        items.get('artist', [])[:config['search_artist_count']]
+    ]
 
     tracks = [
         translator.web_to_track(web_track) for web_track in
-        result['tracks']['items'][:config['search_track_count']]
-    ] if 'tracks' in result else []
+        items.get('track', [])[:config['search_track_count']]
+    ]
 
     return models.SearchResult(
         uri=uri, albums=albums, artists=artists, tracks=tracks)
 
 
+def _search_per_type(config, web_client, sp_query, types, limit):
+    # Search each type in a separate request, and use whatever results are
+    # ready by the deadline. Slow requests keep running in the background and
+    # end up in the cache for the next search.
+    paths = [
+        'search?%s' % urllib.urlencode(sorted({
+            'q': sp_query.encode('utf-8'),
+            'limit': limit,
+            'market': 'from_token',
+            'type': search_type}.items()))
+        for search_type in types]
+    async_results = web_client.get_many_async(paths, _cache)
+
+    result = {}
+    deadline = time.time() + config['timeout']
+    for search_type, async_result in zip(types, async_results):
+        try:
+            result.update(async_result.get(max(deadline - time.time(), 0)))
+        except multiprocessing.TimeoutError:
+            logger.info(
+                'Spotify %s search timed out after %ds',
+                search_type, config['timeout'])
+    return result
+
+
+def _get_search_items(config, web_client, sp_query, types, result, limit):
+    # The Web API returns at most 50 results of each type per request, so
+    # fetch the remaining pages for each type concurrently, but only as far as
+    # the first page's total says there are more results.
+    items = {}
+    paths = []
+    for search_type in types:
+        page = result.get('%ss' % search_type)
+        if page is None:
+            continue
+        items[search_type] = list(page.get('items', []))
+        count = min(
+            config['search_%s_count' % search_type], page.get('total', 0))
+        if not limit or len(items[search_type]) < limit:
+            continue
+        for offset in range(limit, count, limit):
+            paths.append((search_type, 'search?%s' % urllib.urlencode(sorted({
+                'q': sp_query.encode('utf-8'),
+                'limit': limit,
+                'offset': offset,
+                'market': 'from_token',
+                'type': search_type}.items()))))
+
+    if paths:
+        pages = web_client.get_many([path for _, path in paths], _cache)
+        for (search_type, _), page in zip(paths, pages):
+            items[search_type] += page.get(
+                '%ss' % search_type, {}).get('items', [])
+
+    return items
+
+
 def _search_by_uri(config, session, web_client, query):
     tracks = []
+    results = lookup.lookup_many(config, session, web_client, query['uri'])
     for uri in query['uri']:
-        tracks += lookup.lookup(config, session, web_client, uri)
+        tracks += results[uri]
 
     uri = 'spotify:search'
     if len(query['uri']) == 1:
@@ -1,28 +1,42 @@
 from __future__ import unicode_literals
 
 import collections
+import functools
 import logging
 
 from mopidy import models
 
 import spotify
 
+from mopidy_spotify import utils
+
 
 logger = logging.getLogger(__name__)
 
+# Default bound on the number of results each memoized function keeps.
+MEMOIZED_MAX_ENTRIES = 10000
+
 
 class memoized(object):
-    def __init__(self, func):
+    def __init__(self, func, max_entries=MEMOIZED_MAX_ENTRIES, ttl=None):
         self.func = func
-        self.cache = {}
+        self.cache = utils.LRUCache(max_entries, ttl)
+
+    @classmethod
+    def configured(cls, max_entries=MEMOIZED_MAX_ENTRIES, ttl=None):
+        """Return a decorator that memoizes with the given bounds.
+
+        Usage: ``@memoized.configured(max_entries=100, ttl=3600)``.
+        """
+        return functools.partial(cls, max_entries=max_entries, ttl=ttl)
 
     def __call__(self, *args, **kwargs):
         key = self._get_key(args, kwargs)
         if not isinstance(key, collections.Hashable):
             return self.func(*args, **kwargs)
-        if key in self.cache:
+        try:
             return self.cache[key]
-        else:
+        except KeyError:
             value = self.func(*args, **kwargs)
             if value is not None:
                 self.cache[key] = value
@@ -1,7 +1,9 @@
 from __future__ import unicode_literals
 
+import collections
 import contextlib
 import logging
+import threading
 import time
 
 from mopidy import httpclient
@@ -15,7 +17,8 @@ logger = logging.getLogger(__name__)
 TRACE = logging.getLevelName('TRACE')
 
 
-def get_requests_session(proxy_config):
+def get_requests_session(
+        proxy_config, pool_connections=10, pool_maxsize=10, pool_block=False):
     user_agent = '%s/%s' % (Extension.dist_name, __version__)
     proxy = httpclient.format_proxy(proxy_config)
     full_user_agent = httpclient.format_user_agent(user_agent)
@@ -24,11 +27,185 @@ def get_requests_session(proxy_config):
     session.proxies.update({'http': proxy, 'https': proxy})
     session.headers.update({'user-agent': full_user_agent})
 
+    # Keep enough connections per host for all concurrent callers, so they
+    # reuse warm keep-alive connections instead of opening new ones.
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+        pool_block=pool_block)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
     return session
 
 
+def get_connection_pool_stats(session):
+    """Return usage statistics of the session's connection pools by host."""
+    stats = {}
+    for adapter in set(session.adapters.values()):
+        pool_manager = getattr(adapter, 'poolmanager', None)
+        if pool_manager is None:
+            continue
+        for key in pool_manager.pools.keys():
+            pool = pool_manager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            stats['%s://%s:%s' % (pool.scheme, pool.host, pool.port)] = {
+                'connections': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle': idle,
+                'maxsize': pool.pool.maxsize,
+            }
+    return stats
+
+
 @contextlib.contextmanager
 def time_logger(name, level=TRACE):
     start = time.time()
     yield
     logger.log(level, '%s took %dms', name, (time.time() - start) * 1000)
+
+
+class LRUCache(collections.MutableMapping):
+    """Thread-safe mapping holding at most ``max_entries`` items.
+
+    When full, the least recently used item is evicted to make room for a new
+    one. If ``ttl`` is set, items older than ``ttl`` seconds are treated as
+    missing. Hits, misses and evictions are counted for monitoring.
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()  # key -> (value, timestamp)
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            if not self._is_fresh(key):
+                self.misses += 1
+                raise KeyError(key)
+            self.hits += 1
+            # Move the item to the end to mark it as most recently used.
+            item = self._data.pop(key)
+            self._data[key] = item
+            return item[0]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time())
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._is_fresh(key)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(self._fresh_keys())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._fresh_keys())
+
+    def _fresh_keys(self):
+        # Checking freshness drops expired items, so iterate over a copy.
+        return [k for k in list(self._data) if self._is_fresh(k)]
+
+    def _is_fresh(self, key):
+        if key not in self._data:
+            return False
+        if self.ttl is None:
+            return True
+        if time.time() - self._data[key][1] < self.ttl:
+            return True
+        del self._data[key]
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket shared by all callers of a rate-limited API.
+
+    Allows ``rate`` acquisitions per second on average, with bursts of up to
+    ``burst``, or any number of acquisitions if ``rate`` is :class:`None`.
+    :meth:`backoff` blocks all callers until the given number of seconds, at
+    most ``max_backoff``, has passed, e.g. when the API has asked us to slow
+    down. The ``clock`` and ``sleep`` functions can be replaced for testing.
+    """
+
+    def __init__(self, rate=None, burst=None, max_backoff=None,
+                 clock=time.time, sleep=time.sleep):
+        self._rate = float(rate) if rate else None
+        self._burst = burst or max(rate or 0, 1)
+        self._max_backoff = max_backoff
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self._burst
+        self._updated = self._clock()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """Wait until a request may be made, returning the seconds waited.
+
+        Returns :class:`None` instead of waiting if the request can't be made
+        within ``timeout`` seconds.
+        """
+        waited = 0
+        while True:
+            with self._lock:
+                now = self._clock()
+                delay = self._blocked_until - now
+                if delay <= 0:
+                    if self._rate is None:
+                        return waited
+                    elapsed = max(now - self._updated, 0)
+                    self._tokens = min(
+                        self._burst, self._tokens + elapsed * self._rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    delay = (1 - self._tokens) / self._rate
+            if timeout is not None and waited + delay > timeout:
+                return None
+            self._sleep(delay)
+            waited += delay
+
+    def backoff(self, seconds):
+        """Block all callers for ``seconds``, at most ``max_backoff``."""
+        if self._max_backoff is not None:
+            seconds = min(seconds, self._max_backoff)
+        with self._lock:
+            self._blocked_until = max(
+                self._blocked_until, self._clock() + seconds)
+
+    @property
+    def blocked_for(self):
+        """Seconds left until the current back-off window ends."""
+        with self._lock:
+            return max(self._blocked_until - self._clock(), 0)
@@ -3,13 +3,18 @@ from __future__ import unicode_literals
 import collections
 import copy
 import email
+import hashlib
+import json
 import logging
 import os
 import re
+import tempfile
+import threading
 import time
 import urllib
 import urlparse
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 import requests
 
@@ -32,11 +37,21 @@ class OAuthClientError(Exception):
     pass
 
 
+class _InFlightRequest(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = {}
+
+
 class OAuthClient(object):
 
     def __init__(self, base_url, refresh_url, client_id=None,
                  client_secret=None, proxy_config=None, expiry_margin=60,
-                 timeout=10, retries=3, retry_statuses=(500, 502, 503, 429)):
+                 timeout=10, retries=3, retry_statuses=(500, 502, 503, 429),
+                 max_workers=4, pool_connections=10, pool_maxsize=16,
+                 pool_block=False, rate_limit=None, rate_limit_burst=None,
+                 max_backoff=60):
 
         if client_id and client_secret:
             self._auth = (client_id, client_secret)
@@ -55,8 +70,27 @@ class OAuthClient(object):
         self._retry_statuses = retry_statuses
         self._backoff_factor = 0.5
 
+        # Shared by all threads so that one throttled request slows down all
+        # the others too, instead of them collecting more throttled responses.
+        # Spotify doesn't publish a fixed rate limit, so by default requests
+        # are only held back after the Web API has asked us to slow down.
+        self._rate_limiter = utils.RateLimiter(
+            rate_limit, rate_limit_burst, max_backoff=max_backoff)
+
         self._headers = {'Content-Type': 'application/json'}
-        self._session = utils.get_requests_session(proxy_config or {})
+        self._session = utils.get_requests_session(
+            proxy_config or {}, pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize, pool_block=pool_block)
+
+        # Bulk fetches like playlist track pages get their own pool, so that
+        # they can't hold up requests that someone is waiting for.
+        self._max_workers = max_workers
+        self._pool = None
+        self._bulk_pool = None
+        self._pool_lock = threading.Lock()
+
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
 
     def get(self, path, cache=None, *args, **kwargs):
         if self._authorization_failed:
@@ -68,12 +102,36 @@ class OAuthClient(object):
 
         _trace('Get "%s"', path)
 
-        if cache is not None and path in cache:
-            cached_result = cache.get(path)
+        # Look up the cached result only once, as another thread may evict
+        # or expire it at any time.
+        cached_result = cache.get(path) if cache is not None else None
+        if cached_result is not None:
             if not cached_result.expired:
                 return cached_result
             kwargs.setdefault('headers', {}).update(cached_result.etag_headers)
 
+        # Concurrent callers for the same path share a single request.
+        with self._in_flight_lock:
+            request = self._in_flight.get(path)
+            is_leader = request is None
+            if is_leader:
+                request = self._in_flight[path] = _InFlightRequest()
+
+        if not is_leader:
+            _trace('Waiting for in-flight request "%s"', path)
+            request.done.wait()
+            return request.result
+
+        try:
+            request.result = self._fetch(path, cache, *args, **kwargs)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[path]
+            request.done.set()
+
+        return request.result
+
+    def _fetch(self, path, cache=None, *args, **kwargs):
         # TODO: Factor this out once we add more methods.
         # TODO: Don't silently error out.
         try:
@@ -98,6 +156,51 @@ class OAuthClient(object):
 
         return result
 
+    def get_many(self, paths, cache=None, *args, **kwargs):
+        """Get several paths concurrently, returning results in order."""
+        return self._get_many(self._get_pool, paths, cache, args, kwargs)
+
+    def get_many_async(self, paths, cache=None, *args, **kwargs):
+        """Start getting several paths concurrently.
+
+        Returns a :class:`multiprocessing.pool.AsyncResult` for each path, in
+        order, so that callers can wait for the results with a timeout.
+        """
+        return self._apply_async(self._get_pool(), paths, cache, args, kwargs)
+
+    def _get_many(self, get_pool, paths, cache, args, kwargs):
+        paths = list(paths)
+        if len(paths) <= 1 or self._max_workers <= 1:
+            return [self.get(path, cache, *args, **kwargs) for path in paths]
+
+        return [
+            async_result.get() for async_result in
+            self._apply_async(get_pool(), paths, cache, args, kwargs)]
+
+    def _apply_async(self, pool, paths, cache, args, kwargs):
+        def get(path):
+            # Each request needs its own copy of any mutable arguments.
+            return self.get(path, cache, *args, **copy.deepcopy(kwargs))
+
+        return [pool.apply_async(get, (path,)) for path in paths]
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self._max_workers)
+            return self._pool
+
+    def _get_bulk_pool(self):
+        with self._pool_lock:
+            if self._bulk_pool is None:
+                self._bulk_pool = ThreadPool(self._max_workers)
+            return self._bulk_pool
+
+    @property
+    def pool_stats(self):
+        """Usage statistics of the HTTP connection pools by host."""
+        return utils.get_connection_pool_stats(self._session)
+
     def _should_cache_response(self, cache, response):
         return cache is not None and response.status_ok
 
@@ -138,6 +241,7 @@ class OAuthClient(object):
         try_until = time.time() + self._timeout
 
         result = None
+        status_code = None
         backoff_time = None
 
         for i in range(self._number_of_retries):
@@ -149,6 +253,20 @@ class OAuthClient(object):
             elif backoff_time > 0:
                 time.sleep(backoff_time)
 
+            # Give up if all requests are held back for longer than we have
+            # left, instead of blocking the caller until the end of it.
+            waited = self._rate_limiter.acquire(
+                timeout=max(try_until - time.time(), 0))
+            if waited is None:
+                logger.debug(
+                    'Fetching %s aborted: Requests are held back for %.3f '
+                    'seconds', prepared_request.url,
+                    self._rate_limiter.blocked_for)
+                status_code = None
+                result = None
+                break
+            remaining_timeout = max(try_until - time.time(), 1)
+
             try:
                 response = self._session.send(
                     prepared_request, timeout=remaining_timeout)
@@ -162,6 +280,9 @@ class OAuthClient(object):
                 backoff_time = self._parse_retry_after(response)
                 result = WebResponse.from_requests(prepared_request, response)
 
+            if status_code == 429 or backoff_time > 0:
+                self._backoff_all(backoff_time or 2**i * self._backoff_factor)
+
             if status_code >= 400 and status_code < 600:
                 logger.debug('Fetching %s failed: %s',
                              prepared_request.url, status_code)
@@ -188,6 +309,10 @@ class OAuthClient(object):
                          'Mopidy to resolve this problem.')
         return result
 
+    def _backoff_all(self, seconds):
+        logger.debug('Backing off all requests for %.3f seconds.', seconds)
+        self._rate_limiter.backoff(seconds)
+
     def _prepare_url(self, url, *args, **kwargs):
         # TODO: Move this out as a helper and unit-test it directly?
         b = urlparse.urlsplit(self._base_url)
@@ -339,11 +464,170 @@ class WebResponse(dict):
             self.url, datetime.fromtimestamp(self._expires), self._etag)
 
 
+class WebResponseCache(collections.MutableMapping):
+    """Cache of :class:`WebResponse` objects, optionally persisted to disk.
+
+    Up to ``max_entries`` recently used entries are kept in memory. If
+    ``cache_dir`` is given, each entry is also written to a JSON file in that
+    directory, together with its expiry time and ETag, so that an expired
+    entry loaded after a restart can be revalidated with ``If-None-Match``
+    instead of being fetched again. Files that haven't been used for
+    ``max_age`` seconds are deleted when the cache is opened.
+    """
+
+    def __init__(self, cache_dir=None, max_entries=1000,
+                 max_age=30 * 24 * 60 * 60):
+        self._cache_dir = cache_dir
+        self._data = utils.LRUCache(max_entries)
+        self._expired_at = 0
+        self._lock = threading.RLock()
+
+        if cache_dir is not None:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            self._prune(max_age)
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key not in self._data:
+                response = self._load(self._get_path(key), key)
+                if response is None:
+                    raise KeyError(key)
+                self._data[key] = response
+            # Unchanged playlists are served from the cache without being
+            # stored again, so mark the file as used to keep it from being
+            # pruned.
+            self._touch(key)
+            return self._data[key]
+
+    def __setitem__(self, key, response):
+        with self._lock:
+            self._data[key] = response
+            self._store(key, response)
+
+    def __delitem__(self, key):
+        with self._lock:
+            path = self._get_path(key)
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+            elif key not in self._data:
+                raise KeyError(key)
+            self._data.pop(key, None)
+
+    def __iter__(self):
+        with self._lock:
+            keys = set(self._data)
+            if self._cache_dir is not None:
+                for filename in os.listdir(self._cache_dir):
+                    if not filename.endswith('.json'):
+                        continue
+                    path = os.path.join(self._cache_dir, filename)
+                    data = self._read(path)
+                    if data is not None:
+                        keys.add(data['key'])
+        return iter(keys)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def expire(self):
+        """Mark all entries as expired so they are revalidated on next use."""
+        with self._lock:
+            self._expired_at = time.time()
+            for response in self._data.values():
+                response._expires = 0
+
+    def _prune(self, max_age):
+        # Files are touched whenever their responses are used, so the file's
+        # modification time tells when it was last used.
+        pruned_before = time.time() - max_age
+        pruned = 0
+        for filename in os.listdir(self._cache_dir):
+            path = os.path.join(self._cache_dir, filename)
+            try:
+                if os.path.getmtime(path) < pruned_before:
+                    os.remove(path)
+                    pruned += 1
+            except OSError as e:
+                logger.debug('Pruning cached response %s failed: %s', path, e)
+        if pruned:
+            logger.debug(
+                'Pruned %d unused responses from %s', pruned, self._cache_dir)
+
+    def _touch(self, key):
+        path = self._get_path(key)
+        if path is None:
+            return
+        try:
+            os.utime(path, None)
+        except OSError as e:
+            logger.debug('Touching cached response %s failed: %s', path, e)
+
+    def _get_path(self, key):
+        if self._cache_dir is None:
+            return None
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        filename = '%s.json' % hashlib.sha1(key).hexdigest()
+        return os.path.join(self._cache_dir, filename)
+
+    def _read(self, path):
+        try:
+            with open(path) as fh:
+                return json.load(fh)
+        except (IOError, ValueError) as e:
+            logger.debug('Reading cached response %s failed: %s', path, e)
+            return None
+
+    def _load(self, path, key):
+        if path is None or not os.path.exists(path):
+            return None
+
+        data = self._read(path)
+        if data is None or data.get('key') != key:
+            return None
+
+        # Entries stored before the last expire() must be revalidated too.
+        if data['stored'] < self._expired_at:
+            expires = 0
+        else:
+            expires = data['expires']
+
+        _trace('Loaded cached response for %s from %s', key, path)
+        return WebResponse(
+            data['url'], data['data'], expires, data['etag'],
+            data['status_code'])
+
+    def _store(self, key, response):
+        path = self._get_path(key)
+        if path is None:
+            return
+
+        data = {
+            'key': key,
+            'url': response.url,
+            'data': dict(response),
+            'expires': response._expires,
+            'etag': response._etag,
+            'status_code': response._status_code,
+            'stored': time.time(),
+        }
+
+        # Write to a temporary file first so readers never see partial data.
+        try:
+            with tempfile.NamedTemporaryFile(
+                    dir=self._cache_dir, suffix='.tmp', delete=False) as fh:
+                json.dump(data, fh)
+            os.rename(fh.name, path)
+        except (IOError, OSError) as e:
+            logger.warning('Caching response for %s failed: %s', key, e)
+
+
 class SpotifyOAuthClient(OAuthClient):
 
     TRACK_FIELDS = (
-        'next,items(track(type,uri,name,duration_ms,disc_number,track_number,'
-        'artists,album,is_playable,linked_from.uri))'
+        'next,total,items(track(type,uri,name,duration_ms,disc_number,'
+        'track_number,artists,album,is_playable,linked_from.uri))'
     )
     PLAYLIST_FIELDS = (
         'name,owner.id,type,uri,snapshot_id,tracks(%s),' % TRACK_FIELDS
@@ -381,7 +665,7 @@ class SpotifyOAuthClient(OAuthClient):
                 for playlist in page.get('items', []):
                     yield playlist
 
-    def get_playlist(self, uri, cache=None):
+    def get_playlist(self, uri, cache=None, snapshot_id=None):
         try:
             parsed = parse_uri(uri)
             if parsed.type != 'playlist':
@@ -391,25 +675,107 @@ class SpotifyOAuthClient(OAuthClient):
             logger.error(exc)
             return {}
 
-        playlist = self.get('playlists/%s' % parsed.id, cache=cache, params={
+        path = 'playlists/%s' % parsed.id
+        params = {
             'fields': self.PLAYLIST_FIELDS,
-            'market': 'from_token'})
-
-        tracks_path = playlist.get('tracks', {}).get('next')
-        track_pages = self.get_all(tracks_path, cache=cache, params={
+            'market': 'from_token'}
+        track_params = {
             'fields': self.TRACK_FIELDS,
-            'market': 'from_token'})
-
-        more_tracks = []
-        for page in track_pages:
-            more_tracks += page.get('items', [])
-        if more_tracks:
-            # Take a copy to avoid changing the cached response.
-            playlist = copy.deepcopy(playlist)
-            playlist.setdefault('tracks', {}).setdefault('items', [])
-            playlist['tracks']['items'] += more_tracks
-
-        return playlist
+            'market': 'from_token'}
+
+        # A matching snapshot ID means the cached playlist is still current,
+        # even if the cached responses have expired.
+        if snapshot_id is not None and cache is not None:
+            playlist = self._get_cached_playlist(
+                path, params, track_params, snapshot_id, cache)
+            if playlist is not None:
+                return playlist
+
+        playlist = self.get(path, cache=cache, params=params)
+
+        tracks = playlist.get('tracks', {})
+        tracks_paths = _get_page_paths(tracks.get('next'), tracks.get('total'))
+        if tracks_paths is not None:
+            track_pages = self._get_many(
+                self._get_bulk_pool, tracks_paths, cache, (),
+                {'params': track_params})
+        else:
+            track_pages = self.get_all(
+                tracks.get('next'), cache=cache, params=track_params)
+
+        return _merge_track_pages(playlist, track_pages)
+
+    def _get_cached_playlist(
+            self, path, params, track_params, snapshot_id, cache):
+        playlist = cache.get(self._normalise_query_string(path, params))
+        if playlist is None or playlist.get('snapshot_id') != snapshot_id:
+            return None
+
+        def get_cached_page(page_path):
+            return cache.get(
+                self._normalise_query_string(page_path, track_params))
+
+        tracks = playlist.get('tracks', {})
+        tracks_paths = _get_page_paths(tracks.get('next'), tracks.get('total'))
+
+        track_pages = []
+        if tracks_paths is not None:
+            for tracks_path in tracks_paths:
+                page = get_cached_page(tracks_path)
+                if page is None:
+                    return None
+                track_pages.append(page)
+        else:
+            tracks_path = tracks.get('next')
+            while tracks_path is not None:
+                page = get_cached_page(tracks_path)
+                if page is None:
+                    return None
+                track_pages.append(page)
+                tracks_path = page.get('next')
+
+        _trace('Using cached playlist %s at snapshot %s', path, snapshot_id)
+        return _merge_track_pages(playlist, track_pages)
+
+
+def _merge_track_pages(playlist, track_pages):
+    more_tracks = []
+    for page in track_pages:
+        more_tracks += page.get('items', [])
+    if more_tracks:
+        # Take a copy to avoid changing the cached response.
+        playlist = copy.deepcopy(playlist)
+        playlist.setdefault('tracks', {}).setdefault('items', [])
+        playlist['tracks']['items'] += more_tracks
+
+    return playlist
+
+
+def _get_page_paths(next_path, total):
+    """Compute all remaining page URLs from the first ``next`` URL.
+
+    Returns :class:`None` if the URL lacks the ``offset`` and ``limit`` needed
+    to compute the following pages, or if ``total`` is unknown.
+    """
+    if next_path is None or total is None:
+        return None
+
+    u = urlparse.urlsplit(next_path)
+    query = dict(urlparse.parse_qsl(u.query, keep_blank_values=True))
+    try:
+        offset, limit = int(query['offset']), int(query['limit'])
+    except (KeyError, ValueError):
+        return None
+    if limit <= 0:
+        return None
+
+    paths = []
+    for page_offset in range(offset, total, limit):
+        query['offset'] = page_offset
+        encoded_query = urllib.urlencode(sorted(query.items()))
+        paths.append(urlparse.urlunsplit(
+            (u.scheme, u.netloc, u.path, encoded_query, '')))
+    return paths
 
 
 WebLink = collections.namedtuple('WebLink', ['uri', 'type', 'id', 'owner'])
@@ -26,6 +26,7 @@ setup(
     install_requires=[
         'Mopidy >= 2.0',
         'Pykka >= 1.1',
+        'futures >= 2.1',
         'pyspotify >= 2.0.5',
         'requests >= 2.0',
         'setuptools',
@@ -8,7 +8,7 @@ import pytest
 
 import spotify
 
-from mopidy_spotify import backend, library, utils, web
+from mopidy_spotify import backend, images, library, playlists, utils, web
 
 
 @pytest.yield_fixture()
@@ -36,9 +36,13 @@ def config(tmpdir):
             'allow_cache': True,
             'allow_network': True,
             'allow_playlists': True,
+            'playlist_refresh_concurrency': 4,
             'search_album_count': 20,
             'search_artist_count': 10,
             'search_track_count': 50,
+            'search_per_type': False,
+            'web_artist_lookup': False,
+            'image_proxy': False,
             'toplist_countries': ['GB', 'US'],
             'client_id': 'abcd1234',
             'client_secret': 'YWJjZDEyMzQ='
@@ -49,8 +53,19 @@ def config(tmpdir):
 @pytest.yield_fixture
 def web_mock():
     patcher = mock.patch.object(backend, 'web', spec=web)
+    # The backend replaces the playlists web cache and the image cache when
+    # starting.
+    cache_patcher = mock.patch.object(playlists, '_cache', {})
+    cache_patcher.start()
+    image_cache_patcher = mock.patch.object(images, '_cache', {})
+    image_cache_patcher.start()
+    local_uris_patcher = mock.patch.object(images, '_use_local_uris', False)
+    local_uris_patcher.start()
     yield patcher.start()
     patcher.stop()
+    cache_patcher.stop()
+    image_cache_patcher.stop()
+    local_uris_patcher.stop()
 
 
 @pytest.yield_fixture
@@ -423,6 +438,9 @@ def session_mock():
 def web_client_mock():
     web_client_mock = mock.Mock(spec=web.SpotifyOAuthClient)
     web_client_mock.user_id = 'alice'
+    web_client_mock.get.return_value = {}
+    web_client_mock.get_all.return_value = []
+    web_client_mock.get_many.return_value = []
     web_client_mock.get_user_playlists.return_value = []
     return web_client_mock
 
@@ -8,7 +8,7 @@ from mopidy import backend as backend_api
 
 import spotify
 
-from mopidy_spotify import backend, library, playback, playlists
+from mopidy_spotify import backend, images, library, playback, playlists
 
 
 def get_backend(config, session_mock=None):
@@ -137,6 +137,41 @@ def test_on_start_configures_web_client(spotify_mock, web_mock, config):
             in web_mock.SpotifyOAuthClient.call_args_list)
 
 
+def test_on_start_configures_persistent_web_cache(
+        tmpdir, spotify_mock, web_mock, config):
+    get_backend(config).on_start()
+
+    web_mock.WebResponseCache.assert_called_once_with(
+        '%s' % tmpdir.join('cache', 'spotify', 'web'))
+    assert playlists._cache == web_mock.WebResponseCache.return_value
+
+
+def test_on_start_configures_persistent_image_cache(
+        tmpdir, spotify_mock, web_mock, config):
+    get_backend(config).on_start()
+
+    assert isinstance(images._cache, images.ImageCache)
+    assert tmpdir.join('cache', 'spotify', 'images.db').check()
+
+
+def test_on_start_configures_image_proxy(spotify_mock, web_mock, config):
+    config['spotify']['image_proxy'] = True
+
+    get_backend(config).on_start()
+
+    assert images._use_local_uris is True
+
+
+def test_on_start_skips_persistent_web_cache_if_not_allowed(
+        spotify_mock, web_mock, config):
+    config['spotify']['allow_cache'] = False
+
+    get_backend(config).on_start()
+
+    web_mock.WebResponseCache.assert_not_called()
+    assert images._cache == {}
+
+
 def test_on_start_adds_connection_state_changed_handler_to_session(
         spotify_mock, config):
     session = spotify_mock.Session.return_value
@@ -176,31 +211,89 @@ def test_on_start_starts_the_pyspotify_event_loop(spotify_mock, config):
 def test_on_start_logs_in(spotify_mock, web_mock, config):
     backend = get_backend(config)
     backend.on_start()
+    backend._web_thread.join()
 
     spotify_mock.Session.return_value.login.assert_called_once_with(
         'alice', 'password')
     web_mock.SpotifyOAuthClient.return_value.login.assert_called_once()
 
 
+def test_on_start_doesnt_wait_for_web_login(spotify_mock, web_mock, config):
+    login_done = threading.Event()
+    client_mock = web_mock.SpotifyOAuthClient.return_value
+    client_mock.login.side_effect = lambda: login_done.wait(5)
+
+    backend = get_backend(config)
+    backend.on_start()
+
+    assert backend._web_thread.is_alive()
+    client_mock.get_user_playlists.assert_not_called()
+
+    login_done.set()
+    backend._web_thread.join()
+
+    client_mock.get_user_playlists.assert_called_once()
+
+
 def test_on_start_refreshes_playlists(spotify_mock, web_mock, config, caplog):
     backend = get_backend(config)
     backend.on_start()
+    backend._web_thread.join()
 
     client_mock = web_mock.SpotifyOAuthClient.return_value
     client_mock.get_user_playlists.assert_called_once()
     assert 'Refreshed 0 playlists' in caplog.text
 
 
+def test_on_start_triggers_playlists_loaded_event(
+        spotify_mock, web_mock, config, backend_listener_mock):
+    backend = get_backend(config)
+    backend.on_start()
+    backend._web_thread.join()
+
+    backend_listener_mock.send.assert_called_once_with('playlists_loaded')
+
+
 def test_on_start_doesnt_refresh_playlists_if_not_allowed(
-        spotify_mock, web_mock, config, caplog):
+        spotify_mock, web_mock, config, caplog, backend_listener_mock):
     config['spotify']['allow_playlists'] = False
 
     backend = get_backend(config)
     backend.on_start()
+    backend._web_thread.join()
 
     client_mock = web_mock.SpotifyOAuthClient.return_value
     client_mock.get_user_playlists.assert_not_called()
     assert 'Refreshed 0 playlists' not in caplog.text
+    backend_listener_mock.send.assert_not_called()
+
+
+def test_on_start_survives_failing_web_login(
+        spotify_mock, web_mock, config, caplog, backend_listener_mock):
+    client_mock = web_mock.SpotifyOAuthClient.return_value
+    client_mock.login.side_effect = Exception('foo')
+
+    backend = get_backend(config)
+    backend.on_start()
+    backend._web_thread.join()
+
+    assert 'Loading Spotify Web API data failed' in caplog.text
+    assert backend.playlists._loaded
+    backend_listener_mock.send.assert_called_once_with('playlists_loaded')
+
+
+def test_on_stop_waits_for_web_thread(spotify_mock, web_mock, config):
+    backend = get_backend(config)
+    client_mock = web_mock.SpotifyOAuthClient.return_value
+    client_mock.login.side_effect = lambda: backend._web_stopped.wait(5)
+
+    backend.on_start()
+    backend._web_thread = mock.Mock(wraps=backend._web_thread)
+    backend.on_stop()
+
+    backend._web_thread.join.assert_called_once_with(
+        config['spotify']['timeout'])
+    client_mock.get_user_playlists.assert_not_called()
 
 
 def test_on_stop_logs_out_and_waits_for_logout_to_complete(
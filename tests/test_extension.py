@@ -2,7 +2,8 @@ from __future__ import unicode_literals
 
 import mock
 
-from mopidy_spotify import Extension, backend as backend_lib
+from mopidy_spotify import (
+    Extension, backend as backend_lib, frontend as frontend_lib, image_proxy)
 
 
 def test_get_default_config():
@@ -30,9 +31,13 @@ def test_get_config_schema():
     assert 'allow_cache' in schema
     assert 'allow_network' in schema
     assert 'allow_playlists' in schema
+    assert 'playlist_refresh_concurrency' in schema
     assert 'search_album_count' in schema
     assert 'search_artist_count' in schema
     assert 'search_track_count' in schema
+    assert 'search_per_type' in schema
+    assert 'web_artist_lookup' in schema
+    assert 'image_proxy' in schema
     assert 'toplist_countries' in schema
 
 
@@ -42,4 +47,9 @@ def test_setup():
     ext = Extension()
     ext.setup(registry)
 
-    registry.add.assert_called_with('backend', backend_lib.SpotifyBackend)
+    registry.add.assert_any_call('http:app', {
+        'name': 'spotify',
+        'factory': image_proxy.factory,
+    })
+    registry.add.assert_any_call('backend', backend_lib.SpotifyBackend)
+    registry.add.assert_any_call('frontend', frontend_lib.SpotifyFrontend)
@@ -0,0 +1,96 @@
+from __future__ import unicode_literals
+
+import mock
+
+from mopidy import core, models
+
+import pykka
+
+import pytest
+
+from mopidy_spotify import backend, frontend
+
+
+@pytest.fixture
+def core_mock():
+    core_mock = mock.Mock(spec=core.Core)
+    core_mock.playback = mock.Mock(spec=core.PlaybackController)
+    core_mock.tracklist = mock.Mock(spec=core.TracklistController)
+    return core_mock
+
+
+@pytest.yield_fixture
+def backend_ref_mock():
+    backend_ref_mock = mock.Mock()
+    patcher = mock.patch.object(
+        pykka.ActorRegistry, 'get_by_class', return_value=[backend_ref_mock])
+    get_by_class_mock = patcher.start()
+    yield backend_ref_mock
+    patcher.stop()
+    get_by_class_mock.assert_called_with(backend.SpotifyBackend)
+
+
+@pytest.fixture
+def spotify_frontend(config, core_mock):
+    return frontend.SpotifyFrontend(config, core_mock)
+
+
+def test_track_playback_started_prefetches_next_track(
+        spotify_frontend, core_mock, backend_ref_mock):
+    track = models.Track(uri='spotify:track:next')
+    core_mock.tracklist.get_eot_tlid.return_value.get.return_value = 2
+    core_mock.tracklist.filter.return_value.get.return_value = [
+        models.TlTrack(tlid=2, track=track)]
+
+    spotify_frontend.track_playback_started(mock.sentinel.tl_track)
+
+    core_mock.tracklist.filter.assert_called_once_with({'tlid': [2]})
+    playback = backend_ref_mock.proxy.return_value.playback
+    playback.prefetch.assert_called_once_with(track)
+
+
+def test_prefetch_is_skipped_without_next_track(
+        spotify_frontend, core_mock):
+    core_mock.tracklist.get_eot_tlid.return_value.get.return_value = None
+
+    spotify_frontend.track_playback_started(mock.sentinel.tl_track)
+
+    assert core_mock.tracklist.filter.call_count == 0
+
+
+def test_prefetch_is_skipped_for_other_backends(
+        spotify_frontend, core_mock):
+    track = models.Track(uri='local:track:next.mp3')
+    core_mock.tracklist.get_eot_tlid.return_value.get.return_value = 2
+    core_mock.tracklist.filter.return_value.get.return_value = [
+        models.TlTrack(tlid=2, track=track)]
+
+    with mock.patch.object(pykka.ActorRegistry, 'get_by_class') as get_mock:
+        spotify_frontend.track_playback_started(mock.sentinel.tl_track)
+
+    assert get_mock.call_count == 0
+
+
+def test_tracklist_changed_is_ignored_when_not_playing(
+        spotify_frontend, core_mock):
+    core_mock.playback.get_current_tl_track.return_value.get.return_value = (
+        None)
+
+    spotify_frontend.tracklist_changed()
+
+    assert core_mock.tracklist.get_eot_tlid.call_count == 0
+
+
+def test_tracklist_changed_prefetches_next_track_when_playing(
+        spotify_frontend, core_mock, backend_ref_mock):
+    track = models.Track(uri='spotify:track:next')
+    core_mock.playback.get_current_tl_track.return_value.get.return_value = (
+        mock.sentinel.tl_track)
+    core_mock.tracklist.get_eot_tlid.return_value.get.return_value = 2
+    core_mock.tracklist.filter.return_value.get.return_value = [
+        models.TlTrack(tlid=2, track=track)]
+
+    spotify_frontend.tracklist_changed()
+
+    playback = backend_ref_mock.proxy.return_value.playback
+    playback.prefetch.assert_called_once_with(track)
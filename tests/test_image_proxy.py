@@ -0,0 +1,142 @@
+from __future__ import unicode_literals
+
+import os
+import time
+
+import mock
+
+import pytest
+
+import requests
+
+import tornado.concurrent
+import tornado.testing
+import tornado.web
+
+from mopidy_spotify import image_proxy
+
+
+PNG_DATA = b'\x89PNG\r\n\x1a\n' + b'\x00' * 16
+
+
+def test_factory_does_nothing_when_disabled(tmpdir, config):
+    routes = image_proxy.factory(config, None)
+
+    assert routes == []
+    assert not tmpdir.join('cache', 'spotify', 'images').check()
+
+
+def test_factory_creates_cache_dir(tmpdir, config):
+    config['spotify']['image_proxy'] = True
+    config['proxy'] = {'hostname': 'proxy.example.com', 'port': 8080}
+
+    routes = image_proxy.factory(config, None)
+
+    cache_dir = tmpdir.join('cache', 'spotify', 'images')
+    assert cache_dir.check(dir=True)
+    assert len(routes) == 1
+    pattern, handler, kwargs = routes[0]
+    assert pattern == r'/images/([0-9a-f]+)'
+    assert handler is image_proxy.ImageHandler
+    assert kwargs['cache_dir'] == '%s' % cache_dir
+    assert kwargs['timeout'] == 10
+    assert kwargs['session'].proxies['https'] == (
+        'http://proxy.example.com:8080')
+
+
+def test_factory_prunes_unused_images(tmpdir, config):
+    config['spotify']['image_proxy'] = True
+    cache_dir = tmpdir.join('cache', 'spotify', 'images').ensure(dir=True)
+    cache_dir.join('old').write(PNG_DATA, mode='wb')
+    cache_dir.join('new').write(PNG_DATA, mode='wb')
+    old = time.time() - image_proxy._CACHE_MAX_AGE - 1
+    os.utime('%s' % cache_dir.join('old'), (old, old))
+
+    image_proxy.factory(config, None)
+
+    assert not cache_dir.join('old').check()
+    assert cache_dir.join('new').check()
+
+
+def test_download_uses_session():
+    session = mock.Mock(spec=requests.Session)
+    session.get.return_value.content = PNG_DATA
+
+    data = image_proxy._download(session, 'https://i.scdn.co/image/abc', 10)
+
+    assert data == PNG_DATA
+    session.get.assert_called_once_with(
+        'https://i.scdn.co/image/abc', timeout=10)
+    session.get.return_value.raise_for_status.assert_called_once_with()
+
+
+def test_fetch_downloads_in_executor():
+    session = mock.Mock(spec=requests.Session)
+    session.get.return_value.content = PNG_DATA
+
+    future = image_proxy._fetch(session, 'https://i.scdn.co/image/abc', 10)
+
+    assert future.result(timeout=1) == PNG_DATA
+
+
+class ImageHandlerTest(tornado.testing.AsyncHTTPTestCase):
+
+    @pytest.fixture(autouse=True)
+    def setup_cache_dir(self, tmpdir):
+        self.cache_dir = tmpdir
+
+    def get_app(self):
+        return tornado.web.Application([
+            (r'/images/([0-9a-f]+)', image_proxy.ImageHandler, {
+                'cache_dir': '%s' % self.cache_dir,
+                'session': mock.sentinel.session,
+                'timeout': 10,
+            }),
+        ])
+
+    def patch_fetch(self, body=None, error=None):
+        future = tornado.concurrent.Future()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(body)
+        patcher = mock.patch.object(
+            image_proxy, '_fetch', return_value=future)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_serves_cached_image(self):
+        self.cache_dir.join('abc123').write(PNG_DATA, mode='wb')
+        fetch_mock = self.patch_fetch()
+
+        response = self.fetch('/images/abc123')
+
+        assert response.code == 200
+        assert response.body == PNG_DATA
+        assert response.headers['Content-Type'] == 'image/png'
+        fetch_mock.assert_not_called()
+
+    def test_downloads_and_caches_image(self):
+        fetch_mock = self.patch_fetch(body=PNG_DATA)
+
+        response = self.fetch('/images/abc123')
+
+        assert response.code == 200
+        assert response.body == PNG_DATA
+        assert 'max-age' in response.headers['Cache-Control']
+        fetch_mock.assert_called_once_with(
+            mock.sentinel.session, 'https://i.scdn.co/image/abc123', 10)
+        assert self.cache_dir.join('abc123').read(mode='rb') == PNG_DATA
+
+    def test_download_failure(self):
+        self.patch_fetch(error=requests.HTTPError('404 Client Error'))
+
+        response = self.fetch('/images/abc123')
+
+        assert response.code == 502
+        assert not self.cache_dir.join('abc123').check()
+
+    def test_rejects_invalid_image_ids(self):
+        response = self.fetch('/images/..%2Fimages.db')
+
+        assert response.code == 404
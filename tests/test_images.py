@@ -1,5 +1,7 @@
 from __future__ import unicode_literals
 
+import mock
+
 from mopidy import models
 
 import pytest
@@ -8,8 +10,11 @@ from mopidy_spotify import images
 
 
 @pytest.fixture
-def img_provider(provider):
+def img_provider(provider, web_client_mock):
     images._cache = {}
+    images._track_albums.clear()
+    web_client_mock.get_many.side_effect = lambda paths: [
+        web_client_mock.get(path) for path in paths]
     return provider
 
 
@@ -52,8 +57,7 @@ def test_get_artist_images(web_client_mock, img_provider):
     result = img_provider.get_images(uris)
 
     web_client_mock.get.assert_called_once_with(
-        'artists',
-        params={'ids': '4FCGgZrVQtcbDFEap3OAb2,0Nsz79ZcE8E4i3XZhCzZ1l'})
+        'artists?ids=4FCGgZrVQtcbDFEap3OAb2%2C0Nsz79ZcE8E4i3XZhCzZ1l')
 
     assert len(result) == 2
     assert sorted(result.keys()) == sorted(uris)
@@ -103,7 +107,7 @@ def test_get_album_images(web_client_mock, img_provider):
     result = img_provider.get_images(uris)
 
     web_client_mock.get.assert_called_once_with(
-        'albums', params={'ids': '1utFPuvgBHXzLJdqhCDOkg'})
+        'albums?ids=1utFPuvgBHXzLJdqhCDOkg')
 
     assert len(result) == 1
     assert sorted(result.keys()) == sorted(uris)
@@ -142,7 +146,7 @@ def test_get_track_images(web_client_mock, img_provider):
     result = img_provider.get_images(uris)
 
     web_client_mock.get.assert_called_once_with(
-        'tracks', params={'ids': '41shEpOKyyadtG6lDclooa'})
+        'tracks?ids=41shEpOKyyadtG6lDclooa')
 
     assert len(result) == 1
     assert sorted(result.keys()) == sorted(uris)
@@ -192,13 +196,121 @@ def test_max_50_ids_per_request(web_client_mock, img_provider):
 
     img_provider.get_images(uris)
 
-    assert web_client_mock.get.call_count == 2
+    web_client_mock.get_many.assert_called_once_with([
+        'tracks?ids=%s' % '%2C'.join(str(i) for i in range(50)),
+        'tracks?ids=50'])
+
+
+def test_batches_are_requested_together(web_client_mock, img_provider):
+    uris = [
+        'spotify:artist:4FCGgZrVQtcbDFEap3OAb2',
+        'spotify:album:1utFPuvgBHXzLJdqhCDOkg',
+        'spotify:track:41shEpOKyyadtG6lDclooa',
+    ]
+
+    def get(path):
+        uri_type, _, ids = path.partition('?ids=')
+        return {uri_type: [{
+            'id': ids,
+            'images': [{'height': 64, 'url': 'img://0/a', 'width': 64}],
+            'album': {
+                'uri': 'spotify:album:1utFPuvgBHXzLJdqhCDOkg',
+                'images': [{'height': 64, 'url': 'img://0/a', 'width': 64}],
+            },
+        }]}
+
+    web_client_mock.get.side_effect = get
+
+    result = img_provider.get_images(uris)
+
+    web_client_mock.get_many.assert_called_once_with([
+        'albums?ids=1utFPuvgBHXzLJdqhCDOkg',
+        'artists?ids=4FCGgZrVQtcbDFEap3OAb2',
+        'tracks?ids=41shEpOKyyadtG6lDclooa'])
+    assert sorted(result) == sorted(uris)
+
+
+def test_add_track_albums(web_track_mock):
+    images._track_albums.clear()
+
+    images.add_track_albums([
+        web_track_mock,
+        dict(web_track_mock, uri='spotify:track:xyz', linked_from={
+            'uri': 'spotify:track:old'}),
+        {'uri': 'spotify:local:foo:bar:baz', 'album': {}},
+        None,
+    ])
+
+    assert images._track_albums == {'abc': 'def', 'xyz': 'def', 'old': 'def'}
+
+
+def test_add_track_albums_is_bounded(web_track_mock):
+    images._track_albums.clear()
 
-    request_ids_1 = web_client_mock.get.call_args_list[0][1]['params']['ids']
-    assert request_ids_1 == ','.join(str(i) for i in range(50))
+    with mock.patch.object(images._track_albums, 'max_entries', 2):
+        images.add_track_albums([
+            dict(web_track_mock, uri='spotify:track:%s' % track_id)
+            for track_id in 'abc'])
 
-    request_ids_2 = web_client_mock.get.call_args_list[1][1]['params']['ids']
-    assert request_ids_2 == '50'
+    assert len(images._track_albums) == 2
+    assert 'a' not in images._track_albums
+
+
+def test_get_track_images_from_known_album(web_client_mock, img_provider):
+    album_images = (models.Image(uri='img://1/a', width=640, height=640),)
+    images._cache[('album', 'def')] = album_images
+    images._track_albums['abc'] = 'def'
+
+    result = img_provider.get_images(['spotify:track:abc'])
+
+    assert result == {'spotify:track:abc': album_images}
+    web_client_mock.get.assert_not_called()
+
+
+def test_get_track_images_requests_known_album(
+        web_client_mock, img_provider):
+    images._track_albums['abc'] = 'def'
+    images._track_albums['ghi'] = 'def'
+    web_client_mock.get.return_value = {
+        'albums': [{
+            'id': 'def',
+            'images': [{'height': 640, 'url': 'img://1/a', 'width': 640}],
+        }],
+    }
+
+    result = img_provider.get_images([
+        'spotify:track:abc', 'spotify:track:ghi', 'spotify:album:def'])
+
+    web_client_mock.get.assert_called_once_with('albums?ids=def')
+    image = models.Image(uri='img://1/a', width=640, height=640)
+    assert result == {
+        'spotify:track:abc': (image,),
+        'spotify:track:ghi': (image,),
+        'spotify:album:def': (image,),
+    }
+
+
+def test_get_images_with_local_uris(web_client_mock, img_provider):
+    web_client_mock.get.return_value = {
+        'albums': [{
+            'id': 'def',
+            'images': [
+                {'height': 640, 'url': 'https://i.scdn.co/image/ab12',
+                 'width': 640},
+                {'height': 64, 'url': 'img://1/a', 'width': 64},
+            ],
+        }],
+    }
+
+    with mock.patch.object(images, '_use_local_uris', True):
+        result = img_provider.get_images(['spotify:album:def'])
+
+    assert result == {'spotify:album:def': (
+        models.Image(uri='/spotify/images/ab12', width=640, height=640),
+        models.Image(uri='img://1/a', width=64, height=64),
+    )}
+    assert images._cache[('album', 'def')][0].uri == (
+        'https://i.scdn.co/image/ab12')
 
 
 def test_invalid_uri_fails(img_provider):
@@ -220,3 +332,121 @@ def test_service_returns_empty_result(web_client_mock, img_provider):
     result = img_provider.get_images(['spotify:track:41shEpOKyyadtG6lDclooa'])
 
     assert result == {}
+
+
+@pytest.yield_fixture()
+def mock_time():
+    patcher = mock.patch.object(images.time, 'time')
+    mock_time = patcher.start()
+    yield mock_time
+    patcher.stop()
+
+
+@pytest.fixture
+def image_cache(tmpdir):
+    return images.ImageCache('%s' % tmpdir.join('images.db'))
+
+
+@pytest.fixture
+def album_images():
+    return (
+        models.Image(uri='img://1/a', width=640, height=640),
+        models.Image(uri='img://1/b', width=300, height=300),
+    )
+
+
+def test_image_cache_get_and_set(image_cache, album_images):
+    image_cache[('album', 'abc')] = album_images
+
+    assert image_cache[('album', 'abc')] == album_images
+    assert ('album', 'abc') in image_cache
+    assert ('album', 'xyz') not in image_cache
+    assert list(image_cache) == [('album', 'abc')]
+    assert len(image_cache) == 1
+
+
+def test_image_cache_persists_images(tmpdir, image_cache, album_images):
+    image_cache[('album', 'abc')] = album_images
+
+    cache = images.ImageCache('%s' % tmpdir.join('images.db'))
+
+    assert cache[('album', 'abc')] == album_images
+    assert list(cache) == [('album', 'abc')]
+
+
+def test_image_cache_expires_images(
+        tmpdir, image_cache, album_images, mock_time):
+    mock_time.return_value = 1000
+    image_cache[('album', 'abc')] = album_images
+
+    mock_time.return_value = 1011
+    cache = images.ImageCache('%s' % tmpdir.join('images.db'), max_age=10)
+
+    assert ('album', 'abc') not in cache
+    assert len(cache) == 0
+
+
+def test_image_cache_update_stores_images_in_one_transaction(
+        tmpdir, image_cache, album_images):
+    with mock.patch.object(
+            image_cache, '_execute_many',
+            wraps=image_cache._execute_many) as execute_many_mock:
+        image_cache.update({
+            ('album', 'abc'): album_images,
+            ('track', 'def'): album_images})
+
+    assert execute_many_mock.call_count == 1
+    cache = images.ImageCache('%s' % tmpdir.join('images.db'))
+    assert cache[('album', 'abc')] == album_images
+    assert cache[('track', 'def')] == album_images
+
+
+def test_image_cache_delete(tmpdir, image_cache, album_images):
+    image_cache[('album', 'abc')] = album_images
+
+    del image_cache[('album', 'abc')]
+
+    assert ('album', 'abc') not in image_cache
+    cache = images.ImageCache('%s' % tmpdir.join('images.db'))
+    assert ('album', 'abc') not in cache
+
+
+def test_image_cache_without_database(tmpdir, album_images, caplog):
+    cache = images.ImageCache('%s' % tmpdir.join('missing', 'images.db'))
+
+    cache[('album', 'abc')] = album_images
+
+    assert 'Opening image cache' in caplog.text
+    assert cache[('album', 'abc')] == album_images
+
+
+def test_get_images_uses_image_cache(
+        web_client_mock, img_provider, image_cache, album_images):
+    image_cache[('album', 'abc')] = album_images
+    images._cache = image_cache
+
+    result = img_provider.get_images(['spotify:album:abc'])
+
+    assert result == {'spotify:album:abc': album_images}
+    web_client_mock.get.assert_not_called()
+
+
+def test_get_images_stores_new_images_at_once(
+        web_client_mock, img_provider, image_cache):
+    web_client_mock.get.return_value = {'tracks': [{
+        'id': 'track%d' % i,
+        'album': {
+            'uri': 'spotify:album:album%d' % i,
+            'images': [{'height': 64, 'url': 'img://%d/a' % i, 'width': 64}],
+        },
+    } for i in range(3)]}
+    images._cache = image_cache
+
+    with mock.patch.object(image_cache, 'update') as update_mock:
+        img_provider.get_images(
+            ['spotify:track:track%d' % i for i in range(3)])
+
+    update_mock.assert_called_once_with(mock.ANY)
+    assert sorted(update_mock.call_args[0][0]) == [
+        ('album', 'album0'), ('album', 'album1'), ('album', 'album2'),
+        ('track', 'track0'), ('track', 'track1'), ('track', 'track2')]
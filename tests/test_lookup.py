@@ -2,8 +2,12 @@ from __future__ import unicode_literals
 
 import mock
 
+import pytest
+
 import spotify
 
+from mopidy_spotify import lookup
+
 
 def test_lookup_of_invalid_uri(provider, caplog):
     results = provider.lookup('invalid')
@@ -118,6 +122,37 @@ def test_lookup_of_artist_uri(
     assert track.bitrate == 160
 
 
+def test_lookup_of_artist_uri_waits_for_albums_with_one_deadline(
+        session_mock, sp_artist_browser_mock, sp_album_browser_mock, provider):
+    sp_artist_mock = sp_artist_browser_mock.artist
+    sp_album_mock = sp_album_browser_mock.album
+    session_mock.get_link.return_value = sp_artist_mock.link
+
+    with mock.patch.object(lookup, 'time') as time_mock:
+        time_mock.time.side_effect = [100, 101, 102, 103, 104]
+        results = provider.lookup('spotify:artist:abba')
+
+    sp_artist_browser_mock.load.assert_called_once_with(10)
+    assert sp_album_mock.load.call_args_list == [mock.call(9), mock.call(8)]
+    assert sp_album_browser_mock.load.call_args_list == [
+        mock.call(7), mock.call(6)]
+    assert len(results) == 4
+
+
+def test_lookup_of_artist_uri_skips_albums_that_time_out(
+        session_mock, sp_artist_browser_mock, sp_album_browser_mock, provider,
+        caplog):
+    sp_artist_mock = sp_artist_browser_mock.artist
+    session_mock.get_link.return_value = sp_artist_mock.link
+    sp_album_browser_mock.load.side_effect = spotify.Timeout(10)
+
+    results = provider.lookup('spotify:artist:abba')
+
+    assert sp_album_browser_mock.load.call_count == 2
+    assert len(results) == 0
+    assert 'Timed out loading' in caplog.text
+
+
 def test_lookup_of_artist_ignores_unavailable_albums(
         session_mock, sp_artist_browser_mock, sp_album_browser_mock, provider):
     sp_artist_mock = sp_artist_browser_mock.artist
@@ -154,6 +189,119 @@ def test_lookup_of_artist_uri_ignores_various_artists_albums(
     assert len(results) == 0
 
 
+@pytest.fixture
+def web_artist_albums_mock(web_album_mock):
+    return [{
+        'items': [
+            dict(web_album_mock, id='def', album_type='album'),
+            dict(web_album_mock, id='ghi', album_type='compilation'),
+            dict(web_album_mock, id='jkl', album_type='album', artists=[{
+                'uri': 'spotify:artist:0LyfQWJT6nXafLPZqxe9Of'}]),
+        ],
+    }]
+
+
+def test_lookup_of_artist_uri_uses_web_api(
+        session_mock, web_client_mock, web_album_mock, web_track_mock,
+        web_artist_albums_mock, provider, config):
+    config['spotify']['web_artist_lookup'] = True
+    web_track = dict(web_track_mock)
+    del web_track['album']
+    web_client_mock.get_all.return_value = web_artist_albums_mock
+    web_client_mock.get_many.return_value = [
+        {'albums': [dict(web_album_mock, tracks={'items': [web_track]})]}]
+
+    results = provider.lookup('spotify:artist:abba')
+
+    web_client_mock.get_all.assert_called_once_with(
+        'artists/abba/albums', params={
+            'include_groups': 'album,single',
+            'market': 'from_token',
+            'limit': 50})
+    web_client_mock.get_many.assert_called_once_with([
+        'albums?ids=def&market=from_token'])
+    session_mock.get_link.return_value.as_artist.assert_not_called()
+
+    assert len(results) == 1
+    track = results[0]
+    assert track.uri == 'spotify:track:abc'
+    assert track.album.uri == 'spotify:album:def'
+
+
+def test_lookup_of_artist_uri_doesnt_use_web_api_by_default(
+        session_mock, sp_artist_browser_mock, sp_album_browser_mock,
+        web_client_mock, provider):
+    session_mock.get_link.return_value = sp_artist_browser_mock.artist.link
+
+    provider.lookup('spotify:artist:abba')
+
+    web_client_mock.get_all.assert_not_called()
+    session_mock.get_link.return_value.as_artist.assert_called_once_with()
+
+
+def test_lookup_of_artist_uri_fetches_albums_in_batches_of_20(
+        web_client_mock, web_album_mock, web_track_mock, provider, config):
+    config['spotify']['web_artist_lookup'] = True
+    web_client_mock.get_all.return_value = [{
+        'items': [
+            dict(web_album_mock, id='album%d' % i, album_type='album')
+            for i in range(45)],
+    }]
+    web_client_mock.get_many.side_effect = lambda paths: [{
+        'albums': [
+            dict(web_album_mock, tracks={'items': [web_track_mock]})
+            for _ in path.split('%2C')]}
+        for path in paths]
+
+    results = provider.lookup('spotify:artist:abba')
+
+    paths = web_client_mock.get_many.call_args[0][0]
+    assert [len(path.split('%2C')) for path in paths] == [20, 20, 5]
+    assert len(results) == 45
+
+
+def test_lookup_of_artist_uri_pages_through_album_tracks(
+        web_client_mock, web_album_mock, web_track_mock,
+        web_artist_albums_mock, provider, config):
+    config['spotify']['web_artist_lookup'] = True
+    next_url = 'https://api.spotify.com/v1/albums/def/tracks?offset=50'
+    last_url = 'https://api.spotify.com/v1/albums/def/tracks?offset=100'
+    web_client_mock.get_all.return_value = web_artist_albums_mock
+    web_client_mock.get_many.side_effect = [
+        [{'albums': [dict(web_album_mock, tracks={
+            'items': [web_track_mock], 'next': next_url})]}],
+        [{'items': [dict(web_track_mock, uri='spotify:track:xyz')],
+          'next': last_url}],
+    ]
+    web_client_mock.get.return_value = {
+        'items': [dict(web_track_mock, uri='spotify:track:123')]}
+
+    results = provider.lookup('spotify:artist:abba')
+
+    web_client_mock.get_many.assert_called_with([next_url])
+    web_client_mock.get.assert_called_once_with(last_url)
+    assert [track.uri for track in results] == [
+        'spotify:track:abc', 'spotify:track:xyz', 'spotify:track:123']
+
+
+def test_lookup_of_artist_uri_stops_fetching_after_timeout(
+        web_client_mock, web_album_mock, web_track_mock,
+        web_artist_albums_mock, provider, config):
+    config['spotify']['web_artist_lookup'] = True
+    web_client_mock.get_all.return_value = web_artist_albums_mock * 2
+    web_client_mock.get_many.return_value = [
+        {'albums': [dict(web_album_mock, tracks={
+            'items': [web_track_mock], 'next': 'tracks?offset=50'})]}]
+
+    with mock.patch.object(lookup, 'time') as time_mock:
+        time_mock.time.side_effect = [100, 111, 112]
+        results = provider.lookup('spotify:artist:abba')
+
+    web_client_mock.get_many.assert_called_once_with([
+        'albums?ids=def&market=from_token'])
+    assert [track.uri for track in results] == ['spotify:track:abc']
+
+
 def test_lookup_of_playlist_uri(
         session_mock, web_client_mock, web_playlist_mock, sp_track_mock,
         provider):
@@ -164,10 +312,67 @@ def test_lookup_of_playlist_uri(
 
     session_mock.get_link.assert_called_once_with('spotify:track:abc')
     web_client_mock.get_playlist.assert_called_once_with(
-        'spotify:playlist:alice:foo', {})
+        'spotify:playlist:alice:foo', {}, snapshot_id=None)
 
     assert len(results) == 1
     track = results[0]
     assert track.uri == 'spotify:track:abc'
     assert track.name == 'ABC 123'
     assert track.bitrate == 160
+
+
+def test_lookup_many_of_track_uris_uses_web_api(
+        session_mock, web_client_mock, web_track_mock, provider):
+    web_track_xyz = dict(web_track_mock, uri='spotify:track:xyz', name='XYZ')
+    web_client_mock.get.return_value = {
+        'tracks': [web_track_mock, web_track_xyz]}
+
+    results = provider.lookup_many(['spotify:track:abc', 'spotify:track:xyz'])
+
+    web_client_mock.get.assert_called_once_with('tracks', params={
+        'ids': 'abc,xyz', 'market': 'from_token'})
+    session_mock.get_link.assert_not_called()
+    assert len(results) == 2
+    assert results['spotify:track:abc'][0].name == 'ABC 123'
+    assert results['spotify:track:xyz'][0].name == 'XYZ'
+
+
+def test_lookup_many_fetches_tracks_in_batches_of_50(
+        web_client_mock, web_track_mock, provider):
+    uris = ['spotify:track:%d' % i for i in range(120)]
+    web_client_mock.get.side_effect = lambda path, params: {
+        'tracks': [
+            dict(web_track_mock, uri='spotify:track:%s' % track_id)
+            for track_id in params['ids'].split(',')]}
+
+    results = provider.lookup_many(uris)
+
+    assert web_client_mock.get.call_count == 3
+    batch_sizes = [
+        len(call[1]['params']['ids'].split(','))
+        for call in web_client_mock.get.call_args_list]
+    assert batch_sizes == [50, 50, 20]
+    assert sorted(results) == sorted(uris)
+
+
+def test_lookup_many_falls_back_to_libspotify(
+        session_mock, web_client_mock, sp_track_mock, provider):
+    session_mock.get_link.return_value = sp_track_mock.link
+    web_client_mock.get.return_value = {'tracks': [None]}
+
+    results = provider.lookup_many(['spotify:track:abc'])
+
+    session_mock.get_link.assert_called_once_with('spotify:track:abc')
+    assert len(results['spotify:track:abc']) == 1
+    assert results['spotify:track:abc'][0].bitrate == 160
+
+
+def test_lookup_many_of_other_uris(
+        session_mock, web_client_mock, sp_album_browser_mock, provider):
+    sp_album_mock = sp_album_browser_mock.album
+    session_mock.get_link.return_value = sp_album_mock.link
+
+    results = provider.lookup_many(['spotify:album:def'])
+
+    web_client_mock.get.assert_not_called()
+    assert len(results['spotify:album:def']) == 2
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 import threading
+import timeit
 
 import mock
 
@@ -26,6 +27,18 @@ def audio_lib_mock():
     patcher.stop()
 
 
+@pytest.fixture
+def buffer_queue_mock():
+    buffer_queue_mock = mock.Mock(spec=playback.BufferQueue)
+    buffer_queue_mock.put.return_value = True
+    return buffer_queue_mock
+
+
+@pytest.fixture
+def stats():
+    return playback.PlaybackStats()
+
+
 @pytest.fixture
 def session_mock():
     sp_session_mock = mock.Mock(spec=spotify.Session)
@@ -60,10 +73,11 @@ def test_connect_events_adds_music_delivery_handler_to_session(
     assert (mock.call(
         spotify.SessionEvent.MUSIC_DELIVERY,
         playback.music_delivery_callback,
-        audio_mock,
+        playback_provider._buffer_queue,
         playback_provider._seeking_event,
         playback_provider._push_audio_data_event,
-        playback_provider._buffer_timestamp)
+        playback_provider.stats,
+        playback_provider._seek_coalescer)
         in session_mock.on.call_args_list)
 
 
@@ -76,10 +90,22 @@ def test_connect_events_adds_end_of_track_handler_to_session(
     assert (mock.call(
         spotify.SessionEvent.END_OF_TRACK,
         playback.end_of_track_callback,
-        playback_provider._end_of_track_event, audio_mock)
+        playback_provider._end_of_track_event,
+        playback_provider._buffer_queue)
         in session_mock.on.call_args_list)
 
 
+def test_connect_events_starts_pushing_queued_buffers(
+        provider, audio_mock, audio_lib_mock):
+    audio_lib_mock.create_buffer.return_value = mock.sentinel.gst_buffer
+    provider._connect_events()
+
+    provider._buffer_queue.put((b'\x00\x00', 1))
+
+    assert provider._buffer_queue.wait_until_empty(1)
+    audio_mock.emit_data.assert_called_once_with(mock.sentinel.gst_buffer)
+
+
 def test_change_track_aborts_if_no_track_uri(provider):
     track = models.Track()
 
@@ -120,6 +146,93 @@ def test_change_track_sets_up_appsrc(audio_mock, provider):
     audio_mock.set_metadata.assert_called_once_with(track)
 
 
+def test_prefetch_loads_and_prefetches_spotify_track(session_mock, provider):
+    uri = 'spotify:track:next'
+
+    provider.prefetch(models.Track(uri=uri))
+    provider._prefetch_thread.join()
+
+    session_mock.get_track.assert_called_once_with(uri)
+    sp_track_mock = session_mock.get_track.return_value
+    sp_track_mock.load.assert_called_once_with(10)
+    session_mock.player.prefetch.assert_called_once_with(sp_track_mock)
+
+
+def test_prefetch_doesnt_wait_for_track_to_load(session_mock, provider):
+    load_done = threading.Event()
+    sp_track_mock = session_mock.get_track.return_value
+    sp_track_mock.load.side_effect = lambda timeout: load_done.wait(5)
+
+    provider.prefetch(models.Track(uri='spotify:track:next'))
+
+    assert session_mock.player.prefetch.call_count == 0
+    load_done.set()
+    provider._prefetch_thread.join()
+    session_mock.player.prefetch.assert_called_once_with(sp_track_mock)
+
+
+def test_prefetch_skips_already_prefetched_track(session_mock, provider):
+    uri = 'spotify:track:next'
+    provider.prefetch(models.Track(uri=uri))
+    provider._prefetch_thread.join()
+
+    provider.prefetch(models.Track(uri=uri))
+
+    session_mock.get_track.assert_called_once_with(uri)
+    session_mock.player.prefetch.assert_called_once_with(
+        session_mock.get_track.return_value)
+
+
+def test_prefetch_ignores_spotify_error(session_mock, provider, caplog):
+    session_mock.get_track.return_value.load.side_effect = spotify.Error('Foo')
+
+    provider.prefetch(models.Track(uri='spotify:track:next'))
+    provider._prefetch_thread.join()
+
+    assert session_mock.player.prefetch.call_count == 0
+    assert 'Prefetching spotify:track:next failed: Foo' in caplog.text
+
+
+def test_change_track_uses_prefetched_track(session_mock, provider):
+    uri = 'spotify:track:next'
+    provider.prefetch(models.Track(uri=uri))
+    provider._prefetch_thread.join()
+    sp_track_mock = session_mock.get_track.return_value
+    session_mock.get_track.reset_mock()
+
+    assert provider.change_track(models.Track(uri=uri)) is True
+
+    assert session_mock.get_track.call_count == 0
+    session_mock.player.load.assert_called_once_with(sp_track_mock)
+
+
+def test_change_track_ignores_prefetched_track_with_other_uri(
+        session_mock, provider):
+    provider.prefetch(models.Track(uri='spotify:track:next'))
+    provider._prefetch_thread.join()
+    session_mock.get_track.reset_mock()
+
+    assert provider.change_track(models.Track(uri='spotify:track:other'))
+
+    session_mock.get_track.assert_called_once_with('spotify:track:other')
+
+
+def test_change_track_records_its_latency(provider):
+    provider.change_track(models.Track(uri='spotify:track:test'))
+
+    assert provider.stats.stats['latencies']['change_track']['count'] == 1
+
+
+def test_change_track_drops_audio_left_from_previous_track(provider):
+    provider._buffer_queue = mock.Mock(spec=playback.BufferQueue)
+    provider._buffer_queue.wait_until_empty.return_value = False
+
+    assert provider.change_track(models.Track(uri='spotify:track:test'))
+
+    provider._buffer_queue.wait_until_empty.assert_called_once_with(10)
+    provider._buffer_queue.clear.assert_called_once_with()
+
+
 def test_resume_starts_spotify_playback(session_mock, provider):
     provider.resume()
 
@@ -132,6 +245,14 @@ def test_stop_pauses_spotify_playback(session_mock, provider):
     session_mock.player.pause.assert_called_once_with()
 
 
+def test_stop_drops_queued_audio(provider):
+    provider._buffer_queue.put((b'\x00\x00', 1))
+
+    provider.stop()
+
+    assert len(provider._buffer_queue) == 0
+
+
 def test_pause_pauses_spotify_playback(session_mock, provider):
     provider.pause()
 
@@ -146,6 +267,28 @@ def test_on_seek_data_updates_timestamp_and_seeks_in_spotify(
     session_mock.player.seek.assert_called_once_with(1780)
 
 
+def test_on_seek_data_drops_audio_until_seek_is_confirmed(provider):
+    provider.on_seek_data(1780)
+
+    assert provider._seeking_event.is_set()
+
+
+def test_change_track_cancels_held_back_seeks(provider):
+    provider._seek_coalescer = mock.Mock(spec=playback.SeekCoalescer)
+
+    provider.change_track(models.Track(uri='spotify:track:test'))
+
+    provider._seek_coalescer.cancel.assert_called_once_with()
+
+
+def test_on_seek_data_drops_queued_buffers(provider):
+    provider._buffer_queue.put(mock.sentinel.gst_buffer)
+
+    provider.on_seek_data(1780)
+
+    assert len(provider._buffer_queue) == 0
+
+
 def test_on_seek_data_ignores_first_seek_to_zero_on_every_play(
         session_mock, provider):
     provider._seeking_event.set()
@@ -177,17 +320,33 @@ def test_enough_data_callback():
     assert not event.is_set()
 
 
-def test_seek_data_callback():
+def test_seek_data_callback(buffer_queue_mock, stats):
     seeking_event = threading.Event()
-    backend_mock = mock.Mock()
+    seek_coalescer_mock = mock.Mock(spec=playback.SeekCoalescer)
 
-    playback.seek_data_callback(seeking_event, backend_mock, 1340)
+    playback.seek_data_callback(
+        seeking_event, buffer_queue_mock, seek_coalescer_mock, stats, 1340)
 
     assert seeking_event.is_set()
-    backend_mock.playback.on_seek_data.assert_called_once_with(1340)
+    buffer_queue_mock.clear.assert_called_once_with()
+    seek_coalescer_mock.seek.assert_called_once_with(1340)
+
+
+def test_seek_data_callback_forwards_seek_to_backend(provider, backend_mock):
+    backend_mock._actor_proxy = mock.Mock()
+    seeking_event = threading.Event()
 
+    playback.seek_data_callback(
+        seeking_event, provider._buffer_queue, provider._seek_coalescer,
+        provider.stats, 1340)
+    provider._seek_coalescer.cancel()
 
-def test_music_delivery_rejects_data_when_seeking(session_mock, audio_mock):
+    playback_mock = backend_mock._actor_proxy.playback
+    playback_mock.on_seek_data.assert_called_once_with(1340, 1)
+
+
+def test_music_delivery_rejects_data_when_seeking(
+        session_mock, buffer_queue_mock, stats, seek_coalescer):
     audio_format = mock.Mock()
     frames = b'123'
     num_frames = 1
@@ -195,20 +354,21 @@ def test_music_delivery_rejects_data_when_seeking(session_mock, audio_mock):
     seeking_event.set()
     push_audio_data_event = threading.Event()
     push_audio_data_event.set()
-    buffer_timestamp = mock.Mock()
     assert seeking_event.is_set()
 
     result = playback.music_delivery_callback(
         session_mock, audio_format, frames, num_frames,
-        audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+        buffer_queue_mock, seeking_event, push_audio_data_event,
+        stats, seek_coalescer)
 
     assert seeking_event.is_set()
-    assert audio_mock.emit_data.call_count == 0
+    assert buffer_queue_mock.put.call_count == 0
     assert result == num_frames
+    assert stats.stats['counters'] == {'deliveries_dropped_while_seeking': 1}
 
 
 def test_music_delivery_when_seeking_accepts_data_after_empty_delivery(
-        session_mock, audio_mock):
+        session_mock, buffer_queue_mock, stats, seek_coalescer):
 
     audio_format = mock.Mock()
     frames = b''
@@ -217,39 +377,43 @@ def test_music_delivery_when_seeking_accepts_data_after_empty_delivery(
     seeking_event.set()
     push_audio_data_event = threading.Event()
     push_audio_data_event.set()
-    buffer_timestamp = mock.Mock()
     assert seeking_event.is_set()
+    stats.start_timer('seek')
 
     result = playback.music_delivery_callback(
         session_mock, audio_format, frames, num_frames,
-        audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+        buffer_queue_mock, seeking_event, push_audio_data_event,
+        stats, seek_coalescer)
 
     assert not seeking_event.is_set()
-    assert audio_mock.emit_data.call_count == 0
+    assert buffer_queue_mock.put.call_count == 0
     assert result == num_frames
+    assert stats.stats['latencies']['seek']['count'] == 1
 
 
 def test_music_delivery_rejects_data_depending_on_push_audio_data_event(
-        session_mock, audio_mock):
+        session_mock, buffer_queue_mock, stats, seek_coalescer):
 
     audio_format = mock.Mock()
     frames = b'123'
     num_frames = 1
     seeking_event = threading.Event()
     push_audio_data_event = threading.Event()
-    buffer_timestamp = mock.Mock()
     assert not push_audio_data_event.is_set()
 
     result = playback.music_delivery_callback(
         session_mock, audio_format, frames, num_frames,
-        audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+        buffer_queue_mock, seeking_event, push_audio_data_event,
+        stats, seek_coalescer)
 
-    assert audio_mock.emit_data.call_count == 0
+    assert buffer_queue_mock.put.call_count == 0
     assert result == 0
+    assert stats.stats['counters'] == {'deliveries_rejected': 1}
 
 
 def test_music_delivery_shortcuts_if_no_data_in_frames(
-        session_mock, audio_lib_mock, audio_mock):
+        session_mock, audio_lib_mock, buffer_queue_mock, stats,
+        seek_coalescer):
 
     audio_format = mock.Mock(channels=2, sample_rate=44100, sample_type=0)
     frames = b''
@@ -257,19 +421,18 @@ def test_music_delivery_shortcuts_if_no_data_in_frames(
     seeking_event = threading.Event()
     push_audio_data_event = threading.Event()
     push_audio_data_event.set()
-    buffer_timestamp = mock.Mock()
 
     result = playback.music_delivery_callback(
         session_mock, audio_format, frames, num_frames,
-        audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+        buffer_queue_mock, seeking_event, push_audio_data_event,
+        stats, seek_coalescer)
 
     assert result == 0
-    assert audio_lib_mock.create_buffer.call_count == 0
-    assert audio_mock.emit_data.call_count == 0
+    assert buffer_queue_mock.put.call_count == 0
 
 
 def test_music_delivery_rejects_unknown_audio_formats(
-        session_mock, audio_mock):
+        session_mock, buffer_queue_mock, stats, seek_coalescer):
 
     audio_format = mock.Mock(sample_type=17)
     frames = b'123'
@@ -277,21 +440,21 @@ def test_music_delivery_rejects_unknown_audio_formats(
     seeking_event = threading.Event()
     push_audio_data_event = threading.Event()
     push_audio_data_event.set()
-    buffer_timestamp = mock.Mock()
 
     with pytest.raises(AssertionError) as excinfo:
         playback.music_delivery_callback(
             session_mock, audio_format, frames, num_frames,
-            audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+            buffer_queue_mock, seeking_event, push_audio_data_event,
+            stats, seek_coalescer)
 
     assert 'Expects 16-bit signed integer samples' in str(excinfo.value)
 
 
 def test_music_delivery_creates_gstreamer_buffer_and_gives_it_to_audio(
-        session_mock, audio_mock, audio_lib_mock):
+        session_mock, buffer_queue_mock, audio_lib_mock, stats,
+        seek_coalescer):
 
     audio_lib_mock.calculate_duration.return_value = mock.sentinel.duration
-    audio_lib_mock.create_buffer.return_value = mock.sentinel.gst_buffer
 
     audio_format = mock.Mock(channels=2, sample_rate=44100, sample_type=0)
     frames = b'\x00\x00'
@@ -299,26 +462,44 @@ def test_music_delivery_creates_gstreamer_buffer_and_gives_it_to_audio(
     seeking_event = threading.Event()
     push_audio_data_event = threading.Event()
     push_audio_data_event.set()
-    buffer_timestamp = mock.Mock()
-    buffer_timestamp.get.return_value = mock.sentinel.timestamp
 
     result = playback.music_delivery_callback(
         session_mock, audio_format, frames, num_frames,
-        audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+        buffer_queue_mock, seeking_event, push_audio_data_event,
+        stats, seek_coalescer)
 
     audio_lib_mock.calculate_duration.assert_called_once_with(1, 44100)
-    audio_lib_mock.create_buffer.assert_called_once_with(
-        frames, timestamp=mock.sentinel.timestamp,
-        duration=mock.sentinel.duration)
-    buffer_timestamp.increase.assert_called_once_with(mock.sentinel.duration)
-    audio_mock.emit_data.assert_called_once_with(mock.sentinel.gst_buffer)
+    buffer_queue_mock.put.assert_called_once_with(
+        (frames, mock.sentinel.duration))
     assert result == num_frames
+    assert stats.stats['counters'] == {'deliveries': 1}
 
 
-def test_music_delivery_consumes_zero_frames_if_audio_fails(
-        session_mock, audio_mock, audio_lib_mock):
+def test_music_delivery_records_seek_to_first_audio_latency(
+        session_mock, buffer_queue_mock, audio_lib_mock, stats,
+        seek_coalescer, caplog):
 
-    audio_mock.emit_data.return_value.get.return_value = False
+    audio_format = mock.Mock(channels=2, sample_rate=44100, sample_type=0)
+    seeking_event = threading.Event()
+    push_audio_data_event = threading.Event()
+    push_audio_data_event.set()
+    stats.start_timer('seek_to_audio')
+
+    for _ in range(2):
+        playback.music_delivery_callback(
+            session_mock, audio_format, b'\x00\x00', 1,
+            buffer_queue_mock, seeking_event, push_audio_data_event,
+            stats, seek_coalescer)
+
+    assert stats.stats['latencies']['seek_to_audio']['count'] == 1
+    assert 'First audio after seek queued in' in caplog.text
+
+
+def test_music_delivery_consumes_zero_frames_if_queue_is_full(
+        session_mock, buffer_queue_mock, audio_lib_mock, stats,
+        seek_coalescer):
+
+    buffer_queue_mock.put.return_value = False
 
     audio_format = mock.Mock(channels=2, sample_rate=44100, sample_type=0)
     frames = b'\x00\x00'
@@ -326,36 +507,165 @@ def test_music_delivery_consumes_zero_frames_if_audio_fails(
     seeking_event = threading.Event()
     push_audio_data_event = threading.Event()
     push_audio_data_event.set()
-    buffer_timestamp = mock.Mock()
-    buffer_timestamp.get.return_value = mock.sentinel.timestamp
 
     result = playback.music_delivery_callback(
         session_mock, audio_format, frames, num_frames,
-        audio_mock, seeking_event, push_audio_data_event, buffer_timestamp)
+        buffer_queue_mock, seeking_event, push_audio_data_event,
+        stats, seek_coalescer)
 
-    assert buffer_timestamp.increase.call_count == 0
     assert result == 0
+    assert stats.stats['counters'] == {'deliveries_queue_full': 1}
 
 
-def test_end_of_track_callback(session_mock, audio_mock):
+def test_end_of_track_callback(session_mock, buffer_queue_mock):
     end_of_track_event = threading.Event()
 
     playback.end_of_track_callback(
-        session_mock, end_of_track_event, audio_mock)
+        session_mock, end_of_track_event, buffer_queue_mock)
 
     assert end_of_track_event.is_set()
-    audio_mock.emit_data.assert_called_once_with(None)
+    buffer_queue_mock.put_end_of_track.assert_called_once_with()
 
 
-def test_duplicate_end_of_track_callback_is_ignored(session_mock, audio_mock):
+def test_duplicate_end_of_track_callback_is_ignored(
+        session_mock, buffer_queue_mock):
     end_of_track_event = threading.Event()
     end_of_track_event.set()
 
     playback.end_of_track_callback(
-        session_mock, end_of_track_event, audio_mock)
+        session_mock, end_of_track_event, buffer_queue_mock)
 
     assert end_of_track_event.is_set()
-    assert audio_mock.emit_data.call_count == 0
+    assert buffer_queue_mock.put_end_of_track.call_count == 0
+
+
+@pytest.fixture
+def buffer_timestamp():
+    return playback.BufferTimestamp(0)
+
+
+@pytest.fixture
+def buffer_queue(audio_mock, buffer_timestamp, stats):
+    return playback.BufferQueue(
+        audio_mock, 2, buffer_timestamp, stats, retry_interval=0.01)
+
+
+def test_buffer_queue_rejects_buffers_when_full(buffer_queue):
+    assert buffer_queue.put((b'1', 1))
+    assert buffer_queue.put((b'2', 1))
+    assert not buffer_queue.put((b'3', 1))
+    assert len(buffer_queue) == 2
+
+
+def test_buffer_queue_always_accepts_end_of_track(buffer_queue):
+    buffer_queue.put((b'1', 1))
+    buffer_queue.put((b'2', 1))
+
+    buffer_queue.put_end_of_track()
+
+    assert len(buffer_queue) == 3
+
+
+def test_buffer_queue_pushes_timestamped_buffers_in_order(
+        audio_mock, audio_lib_mock, buffer_queue, buffer_timestamp):
+    audio_lib_mock.create_buffer.side_effect = [
+        mock.sentinel.first, mock.sentinel.second]
+    buffer_queue.put((b'1', 10))
+    buffer_queue.put((b'2', 20))
+    buffer_queue.put_end_of_track()
+
+    buffer_queue.start()
+
+    assert buffer_queue.wait_until_empty(1)
+    assert audio_lib_mock.create_buffer.call_args_list == [
+        mock.call(b'1', timestamp=0, duration=10),
+        mock.call(b'2', timestamp=10, duration=20),
+    ]
+    assert audio_mock.emit_data.call_args_list == [
+        mock.call(mock.sentinel.first),
+        mock.call(mock.sentinel.second),
+        mock.call(None),
+    ]
+    assert buffer_timestamp.get() == 30
+
+
+def test_buffer_queue_retries_buffers_rejected_by_audio(
+        audio_mock, audio_lib_mock, buffer_queue, buffer_timestamp, stats):
+    # The audio actor rejects buffers until the new appsrc is set up.
+    audio_mock.emit_data.return_value.get.side_effect = [False, False, True]
+    buffer_queue.put((b'1', 10))
+
+    buffer_queue.start()
+
+    assert buffer_queue.wait_until_empty(1)
+    assert audio_mock.emit_data.call_count == 3
+    assert audio_lib_mock.create_buffer.call_args_list == [
+        mock.call(b'1', timestamp=0, duration=10)] * 3
+    assert buffer_timestamp.get() == 10
+    assert stats.stats['counters'] == {'buffers_rejected': 2}
+
+
+def test_buffer_queue_doesnt_retry_end_of_track(audio_mock, buffer_queue):
+    audio_mock.emit_data.return_value.get.return_value = False
+    buffer_queue.put_end_of_track()
+
+    buffer_queue.start()
+
+    assert buffer_queue.wait_until_empty(1)
+    audio_mock.emit_data.assert_called_once_with(None)
+
+
+def test_buffer_queue_records_emit_data_latency(
+        audio_lib_mock, buffer_queue, stats):
+    buffer_queue.put((b'1', 1))
+
+    buffer_queue.start()
+
+    assert buffer_queue.wait_until_empty(1)
+    assert stats.stats['latencies']['emit_data']['count'] == 1
+
+
+def test_buffer_queue_logs_stats_periodically(
+        audio_mock, audio_lib_mock, buffer_timestamp):
+    stats = mock.Mock(spec=playback.PlaybackStats)
+    stats.timed.return_value = mock.MagicMock()
+    buffer_queue = playback.BufferQueue(
+        audio_mock, 2, buffer_timestamp, stats)
+    buffer_queue.put((b'1', 1))
+
+    buffer_queue.start()
+
+    assert buffer_queue.wait_until_empty(1)
+    stats.maybe_log.assert_called_once_with()
+
+
+def test_buffer_queue_clear_drops_queued_buffers(buffer_queue):
+    buffer_queue.put((b'1', 1))
+    buffer_queue.put((b'2', 1))
+
+    assert buffer_queue.clear() == 2
+
+    assert len(buffer_queue) == 0
+    assert buffer_queue.wait_until_empty(0)
+
+
+def test_buffer_queue_clear_stops_retrying_rejected_buffer(
+        audio_mock, audio_lib_mock, buffer_queue, buffer_timestamp):
+    audio_mock.emit_data.return_value.get.return_value = False
+    buffer_queue.put((b'1', 10))
+    buffer_queue.start()
+
+    assert not buffer_queue.wait_until_empty(0.05)
+    buffer_queue.clear()
+
+    assert buffer_queue.wait_until_empty(1)
+    assert buffer_timestamp.get() == 0
+
+
+def test_buffer_queue_wait_until_empty_times_out(buffer_queue):
+    buffer_queue.put((b'1', 1))
+
+    assert not buffer_queue.wait_until_empty(0.01)
 
 
 def test_buffer_timestamp_wrapper():
@@ -367,3 +677,333 @@ def test_buffer_timestamp_wrapper():
 
     wrapper.increase(3)
     assert wrapper.get() == 20
+
+
+def test_buffer_timestamp_set_resets_increases():
+    wrapper = playback.BufferTimestamp(0)
+    wrapper.increase(5)
+
+    wrapper.set(17)
+    wrapper.increase(3)
+
+    assert wrapper.get() == 20
+
+
+def test_buffer_timestamp_set_to_same_value_resets_increases():
+    wrapper = playback.BufferTimestamp(0)
+    wrapper.increase(5)
+
+    wrapper.set(0)
+
+    assert wrapper.get() == 0
+
+
+def test_buffer_timestamp_seek_during_delivery_is_not_lost():
+    wrapper = playback.BufferTimestamp(100)
+
+    # A delivery reads the timestamp, then the backend actor seeks before the
+    # delivery increases it.
+    assert wrapper.get() == 100
+    wrapper.set(1780)
+    wrapper.increase(3)
+
+    assert wrapper.get() == 1783
+
+
+@pytest.mark.benchmark
+def test_buffer_timestamp_delivery_is_cheaper_than_locking():
+    # Micro-benchmark of the work done per audio delivery, compared with the
+    # previous implementation which took a lock on every access. Timing based,
+    # so it's only run when asked for with "py.test -m benchmark".
+    class LockingBufferTimestamp(object):
+        def __init__(self, value):
+            self._value = value
+            self._lock = threading.RLock()
+
+        def get(self):
+            with self._lock:
+                return self._value
+
+        def increase(self, value):
+            with self._lock:
+                self._value += value
+
+    def per_delivery(wrapper):
+        def deliver():
+            wrapper.get()
+            wrapper.increase(46439909)
+        return min(timeit.repeat(deliver, number=10000, repeat=5))
+
+    assert (
+        per_delivery(playback.BufferTimestamp(0)) <
+        per_delivery(LockingBufferTimestamp(0)))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_playback_stats_counts_events():
+    stats = playback.PlaybackStats()
+
+    stats.increment('deliveries')
+    stats.increment('deliveries', 2)
+
+    assert stats.stats['counters'] == {'deliveries': 3}
+
+
+def test_playback_stats_records_latency_histogram():
+    stats = playback.PlaybackStats()
+
+    stats.record('seek', 0.001)
+    stats.record('seek', 0.04)
+    stats.record('seek', 2.5)
+
+    latency = stats.stats['latencies']['seek']
+    assert latency['count'] == 3
+    assert latency['max_ms'] == 2500
+    assert latency['mean_ms'] == pytest.approx(847)
+    assert latency['histogram']['<=1ms'] == 1
+    assert latency['histogram']['<=50ms'] == 1
+    assert latency['histogram']['>1000ms'] == 1
+    assert sum(latency['histogram'].values()) == 3
+
+
+def test_playback_stats_timers():
+    clock = FakeClock()
+    stats = playback.PlaybackStats(clock=clock)
+
+    stats.start_timer('seek')
+    clock.now += 0.2
+    assert stats.stop_timer('seek') == pytest.approx(0.2)
+    assert stats.stop_timer('seek') is None
+
+    assert stats.stats['latencies']['seek']['count'] == 1
+    assert stats.stats['latencies']['seek']['max_ms'] == pytest.approx(200)
+
+
+def test_playback_stats_timed():
+    clock = FakeClock()
+    stats = playback.PlaybackStats(clock=clock)
+
+    with stats.timed('change_track'):
+        clock.now += 0.03
+
+    assert stats.stats['latencies']['change_track']['mean_ms'] == (
+        pytest.approx(30))
+
+
+def test_playback_stats_counts_deliveries():
+    stats = playback.PlaybackStats()
+
+    stats.count_delivery('deliveries')
+    stats.count_delivery('deliveries')
+    stats.increment('buffers_rejected')
+
+    assert stats.stats['counters'] == {
+        'deliveries': 2, 'buffers_rejected': 1}
+
+
+def test_playback_stats_are_logged_periodically(caplog):
+    clock = FakeClock()
+    stats = playback.PlaybackStats(log_interval=60, clock=clock)
+
+    stats.count_delivery('deliveries')
+    stats.maybe_log()
+    assert 'Spotify playback stats' not in caplog.text
+
+    clock.now += 60
+    stats.count_delivery('deliveries')
+    stats.maybe_log()
+
+    assert 'Spotify playback stats' in caplog.text
+    assert "'deliveries': 2" in caplog.text
+
+
+class FakeTimer(object):
+
+    def __init__(self, interval, function, args):
+        self.interval = interval
+        self.function = function
+        self.args = args
+        self.started = False
+        self.cancelled = False
+
+    def start(self):
+        self.started = True
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        self.function(*self.args)
+
+
+@pytest.fixture
+def timers():
+    return []
+
+
+@pytest.fixture
+def seek_coalescer(stats, timers):
+    def timer(*args):
+        timers.append(FakeTimer(*args))
+        return timers[-1]
+
+    return playback.SeekCoalescer(mock.Mock(), 0.1, stats, timer=timer)
+
+
+def test_seek_coalescer_forwards_first_seek_right_away(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+
+    seek_coalescer._seek.assert_called_once_with(1000, 1)
+    assert len(timers) == 1
+    assert timers[0].started
+    assert timers[0].interval == 0.1
+
+
+def test_seek_coalescer_forwards_latest_seek_when_window_ends(
+        seek_coalescer, timers, stats):
+    seek_coalescer.seek(1000)
+    seek_coalescer.seek(2000)
+    seek_coalescer.seek(3000)
+    seek_coalescer.seek(4000)
+
+    timers[0].fire()
+
+    assert seek_coalescer._seek.call_args_list == [
+        mock.call(1000, 1), mock.call(4000, 4)]
+    assert stats.stats['counters'] == {'seeks': 2, 'seeks_coalesced': 2}
+
+
+def test_seek_coalescer_keeps_window_open_while_seeking(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+    seek_coalescer.seek(2000)
+    timers[0].fire()
+
+    seek_coalescer.seek(3000)
+
+    assert len(timers) == 2
+    assert seek_coalescer._seek.call_count == 2
+
+
+def test_seek_coalescer_closes_window_without_held_back_seeks(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+    timers[0].fire()
+
+    seek_coalescer.seek(2000)
+
+    assert seek_coalescer._seek.call_args_list == [
+        mock.call(1000, 1), mock.call(2000, 2)]
+
+
+def test_seek_coalescer_cancel_drops_held_back_seek(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+    seek_coalescer.seek(2000)
+
+    seek_coalescer.cancel()
+    timers[0].fire()
+
+    assert timers[0].cancelled
+    seek_coalescer._seek.assert_called_once_with(1000, 1)
+
+
+def test_seek_coalescer_is_settled_when_latest_seek_is_confirmed(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+    seek_coalescer.issue(1)
+
+    assert seek_coalescer.confirm()
+
+
+def test_seek_coalescer_one_confirmation_settles_all_issued_seeks(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+    seek_coalescer.issue(1)
+    seek_coalescer.seek(2000)
+    timers[0].fire()
+    seek_coalescer.issue(2)
+
+    # libspotify flushes only once for both seeks.
+    assert seek_coalescer.confirm()
+
+
+def test_seek_coalescer_is_not_settled_while_later_seek_is_forwarded(
+        seek_coalescer, timers):
+    seek_coalescer.seek(1000)
+    seek_coalescer.issue(1)
+    seek_coalescer.seek(2000)
+    timers[0].fire()
+
+    assert not seek_coalescer.confirm()
+
+
+def test_seek_coalescer_skipped_latest_seek_is_settled(
+        seek_coalescer, timers):
+    seek_coalescer.seek(0)
+
+    assert seek_coalescer.skip(1)
+
+
+def test_music_delivery_keeps_dropping_audio_while_later_seek_is_held_back(
+        session_mock, buffer_queue_mock, audio_lib_mock, stats,
+        seek_coalescer, timers):
+    audio_format = mock.Mock(channels=2, sample_rate=44100, sample_type=0)
+    seeking_event = threading.Event()
+    push_audio_data_event = threading.Event()
+    push_audio_data_event.set()
+
+    # Seek A is forwarded and issued, seek B is held back.
+    playback.seek_data_callback(
+        seeking_event, buffer_queue_mock, seek_coalescer, stats, 1000)
+    seek_coalescer.issue(1)
+    playback.seek_data_callback(
+        seeking_event, buffer_queue_mock, seek_coalescer, stats, 2000)
+
+    # libspotify confirms seek A, and then delivers audio from A.
+    for num_frames in [0, 1]:
+        playback.music_delivery_callback(
+            session_mock, audio_format, b'\x00\x00', num_frames,
+            buffer_queue_mock, seeking_event, push_audio_data_event,
+            stats, seek_coalescer)
+
+    assert seeking_event.is_set()
+    assert buffer_queue_mock.put.call_count == 0
+    assert 'seek_to_audio' not in stats.stats['latencies']
+
+
+def test_music_delivery_accepts_audio_after_one_flush_for_two_seeks(
+        session_mock, buffer_queue_mock, audio_lib_mock, stats,
+        seek_coalescer, timers):
+    audio_format = mock.Mock(channels=2, sample_rate=44100, sample_type=0)
+    seeking_event = threading.Event()
+    push_audio_data_event = threading.Event()
+    push_audio_data_event.set()
+
+    # Seeks A and B are both issued before libspotify flushes.
+    playback.seek_data_callback(
+        seeking_event, buffer_queue_mock, seek_coalescer, stats, 1000)
+    seek_coalescer.issue(1)
+    playback.seek_data_callback(
+        seeking_event, buffer_queue_mock, seek_coalescer, stats, 2000)
+    timers[0].fire()
+    seek_coalescer.issue(2)
+
+    # libspotify flushes once, and then delivers audio from B.
+    for num_frames in [0, 1]:
+        playback.music_delivery_callback(
+            session_mock, audio_format, b'\x00\x00', num_frames,
+            buffer_queue_mock, seeking_event, push_audio_data_event,
+            stats, seek_coalescer)
+
+    assert not seeking_event.is_set()
+    assert buffer_queue_mock.put.call_count == 1
@@ -9,7 +9,7 @@ import pytest
 
 import spotify
 
-from mopidy_spotify import playlists
+from mopidy_spotify import images, playlists, web
 
 
 @pytest.fixture
@@ -22,6 +22,7 @@ def web_client_mock(web_client_mock, web_track_mock):
         'tracks': {
             'items': [{'track': web_track_mock}]
         },
+        'snapshot_id': 'abc',
         'uri': 'spotify:user:alice:playlist:foo',
         'type': 'playlist',
     }
@@ -60,6 +61,7 @@ def provider(backend_mock, web_client_mock):
     backend_mock._web_client = web_client_mock
     playlists._cache.clear()
     playlists._sp_links.clear()
+    playlists._snapshot_ids.clear()
     provider = playlists.SpotifyPlaylistsProvider(backend_mock)
     provider._loaded = True
     return provider
@@ -85,12 +87,27 @@ def test_as_list_when_offline(web_client_mock, provider):
     assert len(result) == 0
 
 
-def test_as_list_blocked_when_not_loaded(provider):
+def test_as_list_blocked_when_not_loaded(provider, web_client_mock):
     provider._loaded = False
 
     result = provider.as_list()
 
     assert len(result) == 0
+    web_client_mock.get_user_playlists.assert_not_called()
+
+
+def test_as_list_serves_playlists_refreshed_so_far(provider, web_client_mock):
+    provider._loaded = False
+    provider._playlist_refs = [
+        Ref.playlist(uri='spotify:user:alice:playlist:foo', name='Foo'),
+        Ref.playlist(uri='spotify:user:bob:playlist:baz', name='Baz (by bob)')]
+    provider._refreshed_uris.add('spotify:user:bob:playlist:baz')
+
+    result = provider.as_list()
+
+    assert result == [
+        Ref.playlist(uri='spotify:user:bob:playlist:baz', name='Baz (by bob)')]
+    web_client_mock.get_user_playlists.assert_not_called()
 
 
 def test_as_list_when_playlist_wont_translate(provider, caplog):
@@ -137,6 +154,15 @@ def test_get_items_blocked_when_not_loaded(provider):
     assert result == []
 
 
+def test_get_items_serves_playlists_refreshed_so_far(provider):
+    provider._loaded = False
+    provider._refreshed_uris.add('spotify:user:alice:playlist:foo')
+
+    result = provider.get_items('spotify:user:alice:playlist:foo')
+
+    assert result == [Ref.track(uri='spotify:track:abc', name='ABC 123')]
+
+
 def test_get_items_when_playlist_wont_translate(provider, caplog):
     assert provider.get_items('spotify:user:alice:playlist:malformed') is None
 
@@ -154,10 +180,53 @@ def test_refresh_loads_all_playlists(provider, web_client_mock):
     web_client_mock.get_user_playlists.assert_called_once()
     assert web_client_mock.get_playlist.call_count == 2
     expected_calls = [
-        mock.call('spotify:user:alice:playlist:foo', {}),
-        mock.call('spotify:user:bob:playlist:baz', {}),
+        mock.call('spotify:user:alice:playlist:foo', {}, snapshot_id='abc'),
+        mock.call('spotify:user:bob:playlist:baz', {}, snapshot_id=None),
     ]
-    web_client_mock.get_playlist.assert_has_calls(expected_calls)
+    web_client_mock.get_playlist.assert_has_calls(
+        expected_calls, any_order=True)
+
+
+def test_refresh_uses_configured_concurrency(backend_mock, config):
+    config['spotify']['playlist_refresh_concurrency'] = 1
+
+    provider = playlists.SpotifyPlaylistsProvider(backend_mock)
+
+    with mock.patch.object(playlists, 'ThreadPool') as thread_pool_mock:
+        thread_pool_mock.return_value.imap_unordered.return_value = []
+        provider.refresh()
+
+    thread_pool_mock.assert_called_once_with(1)
+    thread_pool_mock.return_value.imap_unordered.assert_called_once_with(
+        provider._refresh_playlist, [
+            'spotify:user:alice:playlist:foo',
+            'spotify:user:bob:playlist:baz'])
+
+
+def test_refresh_reports_progress(provider, caplog):
+    provider.refresh()
+
+    assert 'Refreshing playlists: 1 of 2 done' in caplog.text
+    assert 'Refreshing playlists: 2 of 2 done' in caplog.text
+
+
+def test_refresh_clears_snapshot_ids(provider, web_client_mock):
+    playlists._snapshot_ids['spotify:user:alice:playlist:gone'] = 'xyz'
+
+    provider.refresh()
+
+    assert playlists._snapshot_ids == {
+        'spotify:user:alice:playlist:foo': 'abc',
+        'spotify:user:bob:playlist:baz': None,
+        'spotify:user:alice:playlist:malformed': None,
+    }
+
+
+def test_as_list_records_snapshot_ids(provider, web_client_mock):
+    provider.as_list()
+
+    assert (playlists._snapshot_ids['spotify:user:alice:playlist:foo'] ==
+            'abc')
 
 
 def test_refresh_when_not_loaded(provider, web_client_mock):
@@ -168,6 +237,10 @@ def test_refresh_when_not_loaded(provider, web_client_mock):
     web_client_mock.get_user_playlists.assert_called_once()
     web_client_mock.get_playlist.assert_called()
     assert provider._loaded
+    assert provider._refreshed_uris == {
+        'spotify:user:alice:playlist:foo', 'spotify:user:bob:playlist:baz'}
+    assert [ref.uri for ref in provider._playlist_refs] == [
+        'spotify:user:alice:playlist:foo', 'spotify:user:bob:playlist:baz']
 
 
 def test_refresh_counts_playlists(provider, caplog):
@@ -176,12 +249,16 @@ def test_refresh_counts_playlists(provider, caplog):
     assert 'Refreshed 2 playlists' in caplog.text
 
 
-def test_refresh_clears_web_cache(provider):
-    playlists._cache = {'foo': 'foobar', 'foo2': 'foofoo'}
+def test_refresh_expires_web_cache(provider):
+    web_response = web.WebResponse(
+        'foo', {}, expires=float('Inf'), status_code=200)
+    playlists._cache['foo'] = web_response
+    assert not web_response.expired
 
     provider.refresh()
 
-    assert len(playlists._cache) == 0
+    assert playlists._cache['foo'] is web_response
+    assert web_response.expired
 
 
 def test_refresh_clears_link_cache(provider):
@@ -288,12 +365,37 @@ def test_playlist_lookup_when_link_invalid(
     assert 'Failed to get link "spotify:track:abc"' in caplog.text
 
 
+def test_playlist_lookup_remembers_track_albums(
+        session_mock, web_client_mock, web_playlist_mock):
+    web_client_mock.get_playlist.return_value = web_playlist_mock
+    images._track_albums.clear()
+
+    playlists.playlist_lookup(
+        session_mock, web_client_mock, 'spotify:user:alice:playlist:foo', None)
+
+    assert images._track_albums == {'abc': 'def'}
+
+
 def test_playlist_lookup_uses_cache(session_mock, web_client_mock):
+    playlists._snapshot_ids.clear()
+
+    playlists.playlist_lookup(
+        session_mock, web_client_mock, 'spotify:user:alice:playlist:foo', None)
+
+    web_client_mock.get_playlist.assert_called_once_with(
+        'spotify:user:alice:playlist:foo', playlists._cache,
+        snapshot_id=None)
+
+
+def test_playlist_lookup_uses_snapshot_id(session_mock, web_client_mock):
+    playlists._snapshot_ids['spotify:user:alice:playlist:foo'] = 'abc'
+
     playlists.playlist_lookup(
         session_mock, web_client_mock, 'spotify:user:alice:playlist:foo', None)
 
     web_client_mock.get_playlist.assert_called_once_with(
-        'spotify:user:alice:playlist:foo', playlists._cache)
+        'spotify:user:alice:playlist:foo', playlists._cache,
+        snapshot_id='abc')
 
 
 def test_on_playlists_loaded_triggers_playlists_loaded_event(
@@ -1,10 +1,14 @@
 from __future__ import unicode_literals
 
+import multiprocessing
+
+import mock
+
 from mopidy import models
 
 import spotify
 
-from mopidy_spotify import search
+from mopidy_spotify import images, search
 
 
 def test_search_with_no_query_returns_nothing(provider, caplog):
@@ -25,8 +29,10 @@ def test_search_with_empty_query_returns_nothing(provider, caplog):
     assert 'Ignored search with empty query' in caplog.text
 
 
-def test_search_by_single_uri(session_mock, sp_track_mock, provider):
+def test_search_by_single_uri(
+        session_mock, web_client_mock, sp_track_mock, provider):
     session_mock.get_link.return_value = sp_track_mock.link
+    web_client_mock.get.return_value = {}
 
     result = provider.search({'uri': ['spotify:track:abc']})
 
@@ -39,8 +45,10 @@ def test_search_by_single_uri(session_mock, sp_track_mock, provider):
     assert track.bitrate == 160
 
 
-def test_search_by_multiple_uris(session_mock, sp_track_mock, provider):
+def test_search_by_multiple_uris(
+        session_mock, web_client_mock, sp_track_mock, provider):
     session_mock.get_link.return_value = sp_track_mock.link
+    web_client_mock.get.return_value = {}
 
     result = provider.search({
         'uri': ['spotify:track:abc', 'spotify:track:abc']
@@ -55,6 +63,19 @@ def test_search_by_multiple_uris(session_mock, sp_track_mock, provider):
     assert track.bitrate == 160
 
 
+def test_search_by_uris_uses_web_api_for_tracks(
+        session_mock, web_client_mock, web_track_mock, provider):
+    web_client_mock.get.return_value = {'tracks': [web_track_mock]}
+
+    result = provider.search({'uri': ['spotify:track:abc']})
+
+    web_client_mock.get.assert_called_once_with('tracks', params={
+        'ids': 'abc', 'market': 'from_token'})
+    session_mock.get_link.assert_not_called()
+    assert len(result.tracks) == 1
+    assert result.tracks[0].uri == 'spotify:track:abc'
+
+
 def test_search_when_offline_returns_nothing(session_mock, provider, caplog):
     session_mock.connection.state = spotify.ConnectionState.OFFLINE
 
@@ -73,7 +94,7 @@ def test_search_returns_albums_and_artists_and_tracks(
     result = provider.search({'any': ['ABBA']})
 
     web_client_mock.get.assert_called_once_with(
-        'search',
+        'search', search._cache,
         params={
             'q': '"ABBA"',
             'limit': 50,
@@ -95,6 +116,16 @@ def test_search_returns_albums_and_artists_and_tracks(
     assert result.tracks[0].uri == 'spotify:track:abc'
 
 
+def test_search_remembers_track_albums(
+        web_client_mock, web_search_mock, provider):
+    web_client_mock.get.return_value = web_search_mock
+    images._track_albums.clear()
+
+    provider.search({'any': ['ABBA']})
+
+    assert images._track_albums == {'abc': 'def'}
+
+
 def test_search_limits_number_of_results(
         web_client_mock, web_search_mock_large, provider, config):
     config['spotify']['search_album_count'] = 4
@@ -121,7 +152,7 @@ def test_sets_api_limit_to_album_count_when_max(
     result = provider.search({'any': ['ABBA']})
 
     web_client_mock.get.assert_called_once_with(
-        'search',
+        'search', search._cache,
         params={
             'q': '"ABBA"',
             'limit': 6,
@@ -142,7 +173,7 @@ def test_sets_api_limit_to_artist_count_when_max(
     result = provider.search({'any': ['ABBA']})
 
     web_client_mock.get.assert_called_once_with(
-        'search',
+        'search', search._cache,
         params={
             'q': '"ABBA"',
             'limit': 6,
@@ -163,7 +194,7 @@ def test_sets_api_limit_to_track_count_when_max(
     result = provider.search({'any': ['ABBA']})
 
     web_client_mock.get.assert_called_once_with(
-        'search',
+        'search', search._cache,
         params={
             'q': '"ABBA"',
             'limit': 6,
@@ -173,6 +204,100 @@ def test_sets_api_limit_to_track_count_when_max(
     assert len(result.tracks) == 6
 
 
+def test_search_fetches_more_pages_for_counts_above_50(
+        web_client_mock, web_album_mock, web_artist_mock, provider, config):
+    config['spotify']['search_album_count'] = 120
+    config['spotify']['search_artist_count'] = 10
+    config['spotify']['search_track_count'] = 0
+
+    web_client_mock.get.return_value = {
+        'albums': {'items': [web_album_mock] * 50, 'total': 300},
+        'artists': {'items': [web_artist_mock] * 10, 'total': 10},
+    }
+    web_client_mock.get_many.return_value = [
+        {'albums': {'items': [web_album_mock] * 50}},
+        {'albums': {'items': [web_album_mock] * 50}},
+    ]
+
+    result = provider.search({'any': ['ABBA']})
+
+    web_client_mock.get_many.assert_called_once_with([
+        'search?limit=50&market=from_token&offset=50&q=%22ABBA%22&type=album',
+        'search?limit=50&market=from_token&offset=100&q=%22ABBA%22&type=album',
+    ], search._cache)
+    assert len(result.albums) == 120
+    assert len(result.artists) == 10
+
+
+def test_search_stops_fetching_pages_when_type_is_exhausted(
+        web_client_mock, web_track_mock, provider, config):
+    config['spotify']['search_track_count'] = 200
+
+    web_client_mock.get.return_value = {
+        'tracks': {'items': [web_track_mock] * 50, 'total': 70},
+    }
+    web_client_mock.get_many.return_value = [
+        {'tracks': {'items': [web_track_mock] * 20}},
+    ]
+
+    result = provider.search({'any': ['ABBA']})
+
+    web_client_mock.get_many.assert_called_once_with([
+        'search?limit=50&market=from_token&offset=50&q=%22ABBA%22&type=track',
+    ], search._cache)
+    assert len(result.tracks) == 70
+
+
+def test_search_doesnt_fetch_more_pages_when_first_page_is_enough(
+        web_client_mock, web_search_mock_large, provider):
+    web_client_mock.get.return_value = web_search_mock_large
+
+    provider.search({'any': ['ABBA']})
+
+    web_client_mock.get_many.assert_not_called()
+
+
+def test_search_per_type(
+        web_client_mock, web_search_mock, provider, config):
+    config['spotify']['search_per_type'] = True
+    async_results = [
+        mock.Mock(**{'get.return_value': {
+            key: web_search_mock[key]}})
+        for key in ['albums', 'artists', 'tracks']]
+    web_client_mock.get_many_async.return_value = async_results
+
+    result = provider.search({'any': ['ABBA']})
+
+    web_client_mock.get_many_async.assert_called_once_with([
+        'search?limit=50&market=from_token&q=%22ABBA%22&type=album',
+        'search?limit=50&market=from_token&q=%22ABBA%22&type=artist',
+        'search?limit=50&market=from_token&q=%22ABBA%22&type=track',
+    ], search._cache)
+    assert len(result.albums) == 1
+    assert len(result.artists) == 1
+    assert len(result.tracks) == 2
+
+
+def test_search_per_type_returns_partial_results_on_timeout(
+        web_client_mock, web_search_mock, provider, config, caplog):
+    config['spotify']['search_per_type'] = True
+    config['spotify']['timeout'] = 1
+    async_results = [
+        mock.Mock(**{'get.return_value': {
+            key: web_search_mock[key]}})
+        for key in ['albums', 'artists']]
+    async_results.append(mock.Mock(**{
+        'get.side_effect': multiprocessing.TimeoutError}))
+    web_client_mock.get_many_async.return_value = async_results
+
+    result = provider.search({'any': ['ABBA']})
+
+    assert len(result.albums) == 1
+    assert len(result.artists) == 1
+    assert len(result.tracks) == 0
+    assert 'Spotify track search timed out after 1s' in caplog.text
+
+
 def test_sets_types_parameter(
         web_client_mock, web_search_mock_large, provider, config,
         session_mock):
@@ -183,7 +308,7 @@ def test_sets_types_parameter(
         {'any': ['ABBA']}, types=['album', 'artist'])
 
     web_client_mock.get.assert_called_once_with(
-        'search',
+        'search', search._cache,
         params={
             'q': '"ABBA"',
             'limit': 50,
@@ -198,7 +323,7 @@ def test_sets_market_parameter(
     provider.search({'any': ['ABBA']})
 
     web_client_mock.get.assert_called_once_with(
-        'search',
+        'search', search._cache,
         params={
             'q': '"ABBA"',
             'limit': 50,
@@ -7,6 +7,38 @@ import spotify
 from mopidy_spotify import translator
 
 
+class TestMemoized(object):
+
+    def test_bounds_number_of_cached_results(self):
+        func = translator.memoized(lambda x: x * 2, max_entries=2)
+
+        assert func(1) == 2
+        assert func(2) == 4
+        assert func(3) == 6
+        assert func(3) == 6
+
+        assert len(func.cache) == 2
+        assert (1,) not in func.cache
+        assert func.cache.stats == {
+            'entries': 2, 'hits': 1, 'misses': 3, 'evictions': 1}
+
+    def test_configured_decorator(self):
+        @translator.web_memoized.configured(max_entries=5, ttl=60)
+        def func(web_data):
+            return web_data['name']
+
+        assert func({'uri': 'foo', 'name': 'Foo'}) == 'Foo'
+        assert isinstance(func, translator.web_memoized)
+        assert func.cache.max_entries == 5
+        assert func.cache.ttl == 60
+        assert len(func.cache) == 1
+
+    def test_default_bound(self):
+        assert (translator.to_track.cache.max_entries ==
+                translator.MEMOIZED_MAX_ENTRIES)
+        assert translator.to_track.cache.ttl is None
+
+
 class TestToArtist(object):
 
     def test_returns_none_if_unloaded(self, sp_artist_mock):
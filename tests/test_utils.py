@@ -2,6 +2,10 @@ from __future__ import unicode_literals
 
 import re
 
+import mock
+
+import pytest
+
 from mopidy_spotify import utils
 
 
@@ -10,3 +14,182 @@ def test_time_logger(caplog):
         pass
 
     assert re.match(r'.*task took \d+ms.*', caplog.text)
+
+
+def test_get_requests_session_configures_connection_pool():
+    session = utils.get_requests_session(
+        {}, pool_connections=2, pool_maxsize=8, pool_block=True)
+
+    adapter = session.get_adapter('https://api.spotify.com/v1')
+    assert adapter is session.get_adapter('http://example.com/')
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 8
+    assert adapter._pool_block is True
+
+
+def test_get_connection_pool_stats():
+    session = utils.get_requests_session({}, pool_maxsize=8)
+    adapter = session.get_adapter('https://api.spotify.com/v1')
+    adapter.poolmanager.connection_from_url('https://api.spotify.com/v1')
+
+    stats = utils.get_connection_pool_stats(session)
+
+    assert stats == {
+        'https://api.spotify.com:443': {
+            'connections': 0, 'requests': 0, 'idle': 0, 'maxsize': 8},
+    }
+
+
+def test_get_connection_pool_stats_without_pools():
+    session = utils.get_requests_session({})
+
+    assert utils.get_connection_pool_stats(session) == {}
+
+
+@pytest.yield_fixture()
+def mock_time():
+    patcher = mock.patch.object(utils.time, 'time')
+    mock_time = patcher.start()
+    mock_time.return_value = 100
+    yield mock_time
+    patcher.stop()
+
+
+def test_lru_cache_get_and_set():
+    cache = utils.LRUCache(2)
+    cache['foo'] = 1
+
+    assert cache['foo'] == 1
+    assert 'foo' in cache
+    assert cache.get('bar') is None
+    assert cache.stats == {
+        'entries': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = utils.LRUCache(2)
+    cache['foo'] = 1
+    cache['bar'] = 2
+    cache['foo']
+
+    cache['baz'] = 3
+
+    assert len(cache) == 2
+    assert 'foo' in cache
+    assert 'bar' not in cache
+    assert 'baz' in cache
+    assert cache.evictions == 1
+
+
+def test_lru_cache_len_ignores_expired_entries(mock_time):
+    cache = utils.LRUCache(2, ttl=10)
+    mock_time.return_value = 100
+    cache['foo'] = 1
+    mock_time.return_value = 105
+    cache['bar'] = 2
+
+    mock_time.return_value = 110
+
+    assert len(cache) == len(list(cache)) == 1
+    assert cache.stats['entries'] == 1
+
+
+def test_lru_cache_expires_entries_after_ttl(mock_time):
+    cache = utils.LRUCache(2, ttl=10)
+    cache['foo'] = 1
+
+    mock_time.return_value = 109
+    assert cache['foo'] == 1
+
+    mock_time.return_value = 110
+    assert 'foo' not in cache
+    assert list(cache) == []
+    assert len(cache) == 0
+    with pytest.raises(KeyError):
+        cache['foo']
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_rate_limiter_allows_bursts(clock):
+    limiter = utils.RateLimiter(2, 3, clock=clock.time, sleep=clock.sleep)
+
+    for _ in range(3):
+        assert limiter.acquire() == 0
+
+    assert clock.sleeps == []
+
+
+def test_rate_limiter_waits_for_tokens(clock):
+    limiter = utils.RateLimiter(2, 1, clock=clock.time, sleep=clock.sleep)
+    limiter.acquire()
+
+    assert limiter.acquire() == 0.5
+    assert clock.sleeps == [0.5]
+
+
+def test_rate_limiter_refills_tokens_over_time(clock):
+    limiter = utils.RateLimiter(2, 2, clock=clock.time, sleep=clock.sleep)
+    limiter.acquire()
+    limiter.acquire()
+
+    clock.now += 1
+
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    assert clock.sleeps == []
+
+
+def test_rate_limiter_backoff_blocks_all_callers(clock):
+    limiter = utils.RateLimiter(10, clock=clock.time, sleep=clock.sleep)
+
+    limiter.backoff(5)
+    limiter.backoff(2)
+
+    assert limiter.blocked_for == 5
+    assert limiter.acquire() == 5
+    assert limiter.blocked_for == 0
+
+
+def test_rate_limiter_without_rate_only_backs_off(clock):
+    limiter = utils.RateLimiter(clock=clock.time, sleep=clock.sleep)
+
+    for _ in range(100):
+        assert limiter.acquire() == 0
+
+    limiter.backoff(3)
+    assert limiter.acquire() == 3
+
+
+def test_rate_limiter_gives_up_after_timeout(clock):
+    limiter = utils.RateLimiter(10, clock=clock.time, sleep=clock.sleep)
+    limiter.backoff(3600)
+
+    assert limiter.acquire(timeout=10) is None
+    assert clock.sleeps == []
+
+
+def test_rate_limiter_caps_backoff(clock):
+    limiter = utils.RateLimiter(
+        max_backoff=60, clock=clock.time, sleep=clock.sleep)
+
+    limiter.backoff(3600)
+
+    assert limiter.blocked_for == 60
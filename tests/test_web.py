@@ -1,6 +1,11 @@
 from __future__ import unicode_literals
 
+import json
+import os
+import threading
+import time
 import urllib
+import urlparse
 
 import mock
 
@@ -9,7 +14,7 @@ import pytest
 import responses
 
 import mopidy_spotify
-from mopidy_spotify import web
+from mopidy_spotify import utils, web
 
 
 @pytest.fixture
@@ -52,6 +57,21 @@ def test_user_agent(oauth_client):
         'Mopidy-Spotify/%s' % mopidy_spotify.__version__)
 
 
+def test_session_connection_pool(oauth_client):
+    adapter = oauth_client._session.get_adapter('https://api.spotify.com/v1')
+
+    assert adapter._pool_maxsize == 16
+    assert adapter._pool_block is False
+
+
+def test_pool_stats(oauth_client):
+    adapter = oauth_client._session.get_adapter('https://api.spotify.com/v1')
+    adapter.poolmanager.connection_from_url('https://api.spotify.com/v1')
+
+    assert oauth_client.pool_stats['https://api.spotify.com:443'] == {
+        'connections': 0, 'requests': 0, 'idle': 0, 'maxsize': 16}
+
+
 @responses.activate
 def test_get_uses_new_access_token(
         web_oauth_mock, web_track_mock, mock_time, oauth_client):
@@ -380,6 +400,26 @@ def test_cache_hit_expired(
     assert result['uri'] == 'new'
 
 
+@responses.activate
+def test_cache_entry_evicted_during_lookup(
+        web_track_mock, oauth_client, mock_time):
+    class EvictingCache(dict):
+        def __contains__(self, key):
+            return True  # Evicted right after the membership test.
+
+    cache = EvictingCache()
+    responses.add(
+        responses.GET, 'https://api.spotify.com/v1/tracks/abc',
+        json=web_track_mock)
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+
+    result = oauth_client.get('https://api.spotify.com/v1/tracks/abc', cache)
+
+    assert len(responses.calls) == 1
+    assert result['uri'] == 'spotify:track:abc'
+
+
 @responses.activate
 def test_dont_cache_bad_status(web_track_mock, mock_time, oauth_client):
     cache = {}
@@ -467,6 +507,288 @@ def test_cache_miss_no_etag(web_response_mock_etag, oauth_client, mock_time):
     assert cache['tracks/xyz'] == result
 
 
+@pytest.mark.parametrize('cache_control,expected_calls', [
+    ('max-age=60', 1),
+    ('no-store', 2),
+])
+@responses.activate
+def test_get_with_lru_cache(
+        oauth_client, mock_time, cache_control, expected_calls):
+    responses.add(
+        responses.GET, 'https://api.spotify.com/v1/search',
+        json={'tracks': {'items': []}},
+        adding_headers={'Cache-Control': cache_control})
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+    cache = utils.LRUCache(10, ttl=3600)
+
+    result1 = oauth_client.get('search', cache, params={'q': 'abba'})
+    mock_time.return_value = 1002
+    result2 = oauth_client.get('search', cache, params={'q': 'abba'})
+
+    assert len(responses.calls) == expected_calls
+    assert result1 == result2
+    assert 'search?q=abba' in cache
+
+
+@responses.activate
+def test_get_shares_in_flight_request(oauth_client):
+    in_flight = web._InFlightRequest()
+    oauth_client._in_flight['tracks/abc'] = in_flight
+    result = []
+
+    thread = threading.Thread(
+        target=lambda: result.append(oauth_client.get('tracks/abc')))
+    thread.start()
+    in_flight.result = web.WebResponse('tracks/abc', {'uri': 'foo'})
+    in_flight.done.set()
+    thread.join(5)
+
+    assert len(responses.calls) == 0
+    assert result == [in_flight.result]
+    assert result[0] is in_flight.result
+
+
+@responses.activate
+def test_get_coalesces_on_normalised_path(oauth_client):
+    in_flight = web._InFlightRequest()
+    in_flight.result = web.WebResponse('search?q=x&type=y', {'uri': 'foo'})
+    in_flight.done.set()
+    oauth_client._in_flight['search?q=x&type=y'] = in_flight
+
+    result = oauth_client.get('search', params={'type': 'y', 'q': 'x'})
+
+    assert len(responses.calls) == 0
+    assert result is in_flight.result
+
+
+@responses.activate
+def test_get_clears_in_flight_request(oauth_client, mock_time):
+    responses.add(
+        responses.GET, 'https://api.spotify.com/v1/tracks/abc',
+        json={'uri': 'spotify:track:abc'})
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+
+    oauth_client.get('tracks/abc')
+    oauth_client.get('tracks/abc')
+
+    assert len(responses.calls) == 2
+    assert oauth_client._in_flight == {}
+
+
+def test_rate_limiter():
+    client = web.OAuthClient(
+        base_url='https://api.spotify.com/v1',
+        refresh_url='https://auth.mopidy.com/spotify/token',
+        rate_limit=5, rate_limit_burst=7)
+
+    assert client._rate_limiter._rate == 5
+    assert client._rate_limiter._burst == 7
+
+
+def test_rate_limiter_only_backs_off_by_default():
+    client = web.OAuthClient(
+        base_url='https://api.spotify.com/v1',
+        refresh_url='https://auth.mopidy.com/spotify/token')
+
+    assert client._rate_limiter._rate is None
+    assert client._rate_limiter._max_backoff == 60
+
+
+@responses.activate
+def test_get_acquires_rate_limiter(oauth_client, mock_time):
+    responses.add(
+        responses.GET, 'https://api.spotify.com/v1/tracks/abc',
+        json={'uri': 'spotify:track:abc'})
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+    oauth_client._rate_limiter = mock.Mock(spec=utils.RateLimiter)
+
+    oauth_client.get('tracks/abc')
+
+    oauth_client._rate_limiter.acquire.assert_called_once_with(timeout=10)
+    oauth_client._rate_limiter.backoff.assert_not_called()
+
+
+@responses.activate
+def test_get_gives_up_when_held_back_beyond_timeout(
+        oauth_client, mock_time, caplog):
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+    oauth_client._rate_limiter = mock.Mock(spec=utils.RateLimiter)
+    oauth_client._rate_limiter.acquire.return_value = None
+    oauth_client._rate_limiter.blocked_for = 60
+
+    assert oauth_client.get('tracks/abc') == {}
+
+    assert len(responses.calls) == 0
+    assert 'Requests are held back for 60.000 seconds' in caplog.text
+
+
+@pytest.mark.parametrize('headers,expected', [
+    ({'Retry-After': '3'}, 3),
+    ({}, 0.5),
+])
+@responses.activate
+def test_get_backs_off_all_requests_when_throttled(
+        oauth_client, mock_time, headers, expected):
+    responses.add(
+        responses.GET, 'https://api.spotify.com/v1/tracks/abc',
+        status=429, adding_headers=headers)
+    oauth_client._expires = 2000
+    oauth_client._number_of_retries = 1
+    mock_time.return_value = 1001
+    oauth_client._rate_limiter = mock.Mock(spec=utils.RateLimiter)
+
+    assert oauth_client.get('tracks/abc') == {}
+
+    oauth_client._rate_limiter.backoff.assert_called_once_with(expected)
+
+
+def test_get_clears_in_flight_request_on_error(oauth_client, mock_time):
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+
+    with mock.patch.object(oauth_client, '_request_with_retries') as req_mock:
+        req_mock.side_effect = Exception('foo')
+        with pytest.raises(Exception):
+            oauth_client.get('tracks/abc')
+
+    assert oauth_client._in_flight == {}
+
+
+@pytest.fixture
+def web_cache(tmpdir):
+    return web.WebResponseCache('%s' % tmpdir.join('web'))
+
+
+def test_web_response_cache_in_memory(web_response_mock):
+    cache = web.WebResponseCache()
+    cache['tracks/abc'] = web_response_mock
+
+    assert cache['tracks/abc'] is web_response_mock
+    assert 'tracks/abc' in cache
+    assert 'tracks/xyz' not in cache
+    assert len(cache) == 1
+
+
+def test_web_response_cache_persists_responses(
+        tmpdir, web_response_mock_etag, mock_time):
+    mock_time.return_value = 100
+    path = '%s' % tmpdir.join('web')
+    web.WebResponseCache(path)['tracks/abc'] = web_response_mock_etag
+
+    result = web.WebResponseCache(path)['tracks/abc']
+
+    assert result is not web_response_mock_etag
+    assert result == web_response_mock_etag
+    assert result.url == web_response_mock_etag.url
+    assert result._expires == 1000
+    assert result._etag == '"1234"'
+    assert result._status_code == 200
+
+
+def test_web_response_cache_missing_key(web_cache):
+    with pytest.raises(KeyError):
+        web_cache['tracks/abc']
+
+    assert web_cache.get('tracks/abc') is None
+
+
+def test_web_response_cache_ignores_corrupt_files(
+        web_cache, web_response_mock, caplog):
+    web_cache['tracks/abc'] = web_response_mock
+    path = web_cache._get_path('tracks/abc')
+    with open(path, 'w') as fh:
+        fh.write('junk')
+    web_cache._data.clear()
+
+    assert 'tracks/abc' not in web_cache
+    assert 'Reading cached response %s failed' % path in caplog.text
+
+
+def test_web_response_cache_delete(tmpdir, web_cache, web_response_mock):
+    web_cache['tracks/abc'] = web_response_mock
+
+    del web_cache['tracks/abc']
+
+    assert 'tracks/abc' not in web_cache
+    assert len(tmpdir.join('web').listdir()) == 0
+
+
+def test_web_response_cache_prunes_unused_files(
+        tmpdir, web_cache, web_response_mock):
+    web_cache['tracks/abc'] = web_response_mock
+    web_cache['tracks/xyz'] = web_response_mock
+    old = time.time() - 31 * 24 * 60 * 60
+    os.utime(web_cache._get_path('tracks/abc'), (old, old))
+
+    cache = web.WebResponseCache('%s' % tmpdir.join('web'))
+
+    assert 'tracks/abc' not in cache
+    assert 'tracks/xyz' in cache
+    assert len(tmpdir.join('web').listdir()) == 1
+
+
+def test_web_response_cache_keeps_files_that_are_used(
+        tmpdir, web_cache, web_response_mock):
+    web_cache['tracks/abc'] = web_response_mock
+    old = time.time() - 31 * 24 * 60 * 60
+    os.utime(web_cache._get_path('tracks/abc'), (old, old))
+
+    # Served from memory, without being stored again.
+    assert web_cache['tracks/abc'] == web_response_mock
+
+    cache = web.WebResponseCache('%s' % tmpdir.join('web'))
+    assert 'tracks/abc' in cache
+
+
+def test_web_response_cache_bounds_entries_in_memory(
+        web_cache, web_response_mock):
+    web_cache._data.max_entries = 1
+
+    web_cache['tracks/abc'] = web_response_mock
+    web_cache['tracks/xyz'] = web_response_mock
+
+    assert len(web_cache._data) == 1
+    assert web_cache['tracks/abc'] == web_response_mock
+
+
+def test_web_response_cache_expire(
+        tmpdir, web_cache, web_response_mock, mock_time):
+    mock_time.return_value = 100
+    web_cache['tracks/abc'] = web_response_mock
+    restarted_cache = web.WebResponseCache('%s' % tmpdir.join('web'))
+
+    mock_time.return_value = 200
+    web_cache.expire()
+    restarted_cache.expire()
+
+    assert web_cache['tracks/abc'].expired
+    assert restarted_cache['tracks/abc'].expired
+
+
+@responses.activate
+def test_web_response_cache_revalidates_after_restart(
+        tmpdir, web_response_mock_etag, oauth_client, mock_time):
+    mock_time.return_value = 100
+    path = '%s' % tmpdir.join('web')
+    web.WebResponseCache(path)['tracks/abc'] = web_response_mock_etag
+    cache = web.WebResponseCache(path)
+    responses.add(
+        responses.GET, 'https://api.spotify.com/v1/tracks/abc',
+        json={}, status=304)
+    oauth_client._expires = 2000
+    mock_time.return_value = 1001
+
+    result = oauth_client.get('tracks/abc', cache)
+
+    assert len(responses.calls) == 1
+    assert responses.calls[0].request.headers['If-None-Match'] == '"1234"'
+    assert result['uri'] == 'spotify:track:abc'
+
+
 @pytest.fixture
 def spotify_client(config):
     return web.SpotifyOAuthClient(
@@ -492,6 +814,7 @@ class TestSpotifyOAuthClient(object):
 
     @pytest.mark.parametrize('field', [
         ('next'),
+        ('total'),
         ('items(track'),
         ('type'),
         ('uri'),
@@ -698,6 +1021,116 @@ class TestSpotifyOAuthClient(object):
         assert len(responses.calls) == 2
         assert result['tracks']['items'] == [1, 2, 3, 4, 5]
 
+    @responses.activate
+    def test_get_playlist_fetches_remaining_pages_concurrently(
+            self, spotify_client):
+        responses.add(
+            responses.GET, self.url('playlists/foo'),
+            json={'tracks': {
+                'items': [1, 2],
+                'next': self.url('playlists/foo/tracks?offset=2&limit=2'),
+                'total': 7}})
+
+        def tracks_callback(request):
+            query = urlparse.parse_qs(urlparse.urlsplit(request.url).query)
+            offset = int(query['offset'][0])
+            items = range(offset + 1, min(offset + 3, 8))
+            return (200, {}, json.dumps({'items': items}))
+
+        responses.add_callback(
+            responses.GET, self.url('playlists/foo/tracks'),
+            callback=tracks_callback)
+
+        with mock.patch.object(spotify_client, 'get_all') as get_all_mock:
+            result = spotify_client.get_playlist('spotify:playlist:foo')
+
+        assert get_all_mock.call_count == 0
+        assert len(responses.calls) == 4
+        assert result['tracks']['items'] == [1, 2, 3, 4, 5, 6, 7]
+
+    def test_get_many_returns_results_in_order(self, spotify_client):
+        paths = ['page%d' % i for i in range(10)]
+
+        with mock.patch.object(spotify_client, 'get') as get_mock:
+            get_mock.side_effect = lambda path, *a, **kw: path
+            results = spotify_client.get_many(paths, params={'foo': 'bar'})
+
+        assert results == paths
+        assert get_mock.call_count == 10
+        get_mock.assert_any_call('page3', None, params={'foo': 'bar'})
+
+    def test_get_many_isnt_held_up_by_playlist_track_pages(
+            self, spotify_client):
+        release = threading.Event()
+        pages_done = []
+
+        def get(path, *args, **kwargs):
+            if path.startswith('playlists/foo/tracks'):
+                release.wait(5)
+                pages_done.append(path)
+                return {'items': []}
+            elif path.startswith('playlists/foo'):
+                return {'tracks': {
+                    'items': [],
+                    'next': 'playlists/foo/tracks?offset=0&limit=1',
+                    'total': 20}}
+            return (path, len(pages_done))
+
+        with mock.patch.object(spotify_client, 'get') as get_mock:
+            get_mock.side_effect = get
+            playlist_thread = threading.Thread(
+                target=spotify_client.get_playlist,
+                args=('spotify:playlist:foo',))
+            playlist_thread.start()
+            try:
+                results = spotify_client.get_many(['a', 'b'])
+            finally:
+                release.set()
+                playlist_thread.join()
+
+        assert results == [('a', 0), ('b', 0)]
+
+    def test_get_many_async_isnt_held_up_by_playlist_track_pages(
+            self, spotify_client):
+        release = threading.Event()
+
+        def get(path, *args, **kwargs):
+            if path.startswith('playlists/foo/tracks'):
+                release.wait(5)
+                return {'items': []}
+            elif path.startswith('playlists/foo'):
+                return {'tracks': {
+                    'items': [],
+                    'next': 'playlists/foo/tracks?offset=0&limit=1',
+                    'total': 20}}
+            return path
+
+        with mock.patch.object(spotify_client, 'get') as get_mock:
+            get_mock.side_effect = get
+            playlist_thread = threading.Thread(
+                target=spotify_client.get_playlist,
+                args=('spotify:playlist:foo',))
+            playlist_thread.start()
+            try:
+                async_results = spotify_client.get_many_async(['a', 'b'])
+
+                assert [r.get(1) for r in async_results] == ['a', 'b']
+                assert not release.is_set()
+            finally:
+                release.set()
+                playlist_thread.join()
+
+    def test_get_many_async_returns_async_results_in_order(
+            self, spotify_client):
+        paths = ['page%d' % i for i in range(3)]
+
+        with mock.patch.object(spotify_client, 'get') as get_mock:
+            get_mock.side_effect = lambda path, *a, **kw: path
+            async_results = spotify_client.get_many_async(paths, {})
+
+            assert [r.get(1) for r in async_results] == paths
+        get_mock.assert_any_call('page1', {})
+
     @responses.activate
     def test_get_playlist_uses_cache(self, mock_time, spotify_client):
         responses.add(
@@ -727,6 +1160,71 @@ class TestSpotifyOAuthClient(object):
         assert len(responses.calls) == 0
         assert result1 == result2
 
+    @responses.activate
+    def test_get_playlist_uses_cache_for_same_snapshot(
+            self, mock_time, spotify_client):
+        responses.add(
+            responses.GET, self.url('playlists/foo'),
+            json={'snapshot_id': 'abc', 'tracks': {
+                'items': [1, 2], 'next': 'playlists/foo/tracks'}})
+        responses.add(
+            responses.GET, self.url('playlists/foo/tracks'),
+            json={'items': [3, 4, 5]})
+        mock_time.return_value = -1000
+        cache = web.WebResponseCache()
+        spotify_client.get_playlist('spotify:playlist:foo', cache)
+        cache.expire()
+        mock_time.return_value = 1000
+
+        responses.calls.reset()
+        result = spotify_client.get_playlist(
+            'spotify:playlist:foo', cache, snapshot_id='abc')
+
+        assert len(responses.calls) == 0
+        assert result['tracks']['items'] == [1, 2, 3, 4, 5]
+
+    @responses.activate
+    def test_get_playlist_refetches_changed_snapshot(
+            self, mock_time, spotify_client):
+        responses.add(
+            responses.GET, self.url('playlists/foo'),
+            json={'snapshot_id': 'abc', 'tracks': {'items': [1, 2]}})
+        mock_time.return_value = -1000
+        cache = web.WebResponseCache()
+        spotify_client.get_playlist('spotify:playlist:foo', cache)
+        cache.expire()
+        mock_time.return_value = 1000
+
+        responses.calls.reset()
+        result = spotify_client.get_playlist(
+            'spotify:playlist:foo', cache, snapshot_id='def')
+
+        assert len(responses.calls) == 1
+        assert result['tracks']['items'] == [1, 2]
+
+    @responses.activate
+    def test_get_playlist_refetches_snapshot_with_missing_pages(
+            self, mock_time, spotify_client):
+        responses.add(
+            responses.GET, self.url('playlists/foo'),
+            json={'snapshot_id': 'abc', 'tracks': {
+                'items': [1, 2], 'next': 'playlists/foo/tracks'}})
+        responses.add(
+            responses.GET, self.url('playlists/foo/tracks'),
+            json={'items': [3, 4, 5]})
+        mock_time.return_value = -1000
+        cache = web.WebResponseCache()
+        spotify_client.get_playlist('spotify:playlist:foo', cache)
+        base_url = self.url('')
+        del cache[responses.calls[1].request.url[len(base_url):]]
+
+        responses.calls.reset()
+        result = spotify_client.get_playlist(
+            'spotify:playlist:foo', cache, snapshot_id='abc')
+
+        assert len(responses.calls) == 1
+        assert result['tracks']['items'] == [1, 2, 3, 4, 5]
+
     @pytest.mark.parametrize('uri,msg', [
         ('spotify:artist:foo', 'Spotify playlist'),
         ('my-bad-uri', 'Spotify'),
@@ -736,6 +1234,24 @@ class TestSpotifyOAuthClient(object):
         assert 'Could not parse %r as a %s URI' % (uri, msg) in caplog.text
 
 
+@pytest.mark.parametrize('next_path,total,expected', [
+    ('tracks?offset=100&limit=100', 350, [
+        'tracks?limit=100&offset=100',
+        'tracks?limit=100&offset=200',
+        'tracks?limit=100&offset=300']),
+    ('https://foo/tracks?limit=50&offset=50&market=SE', 100, [
+        'https://foo/tracks?limit=50&market=SE&offset=50']),
+    ('tracks?offset=100&limit=100', 100, []),
+    ('tracks?offset=100&limit=100', None, None),
+    ('tracks?offset=100', 350, None),
+    ('tracks?offset=junk&limit=100', 350, None),
+    ('tracks?offset=0&limit=0', 350, None),
+    (None, 350, None),
+])
+def test_get_page_paths(next_path, total, expected):
+    assert web._get_page_paths(next_path, total) == expected
+
+
 @pytest.mark.parametrize('uri,type_,id_', [
     ('spotify:playlist:foo', 'playlist', 'foo'),
     ('spotify:track:bar', 'track', 'bar'),